@@ -0,0 +1,114 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from generate_message import generate_message, lemmatize_text
+from ngram_store import get_ngram_store
+from similar_messages import get_similarity_index
+
+OUTPUT_FILE = "data/generated_messages.jsonl"
+BATCH_CHUNK_SIZE = 200
+SIMILAR_MESSAGES = 10
+MAX_WORDS = 25
+
+def load_jobs(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    if text.lstrip().startswith('['):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+def split_jobs(jobs, chunk_size=BATCH_CHUNK_SIZE):
+    for job_index, job in enumerate(jobs):
+        for start in range(0, job["count"], chunk_size):
+            yield {**job, "job": job_index, "start": start, "count": min(chunk_size, job["count"] - start)}
+
+def warm_up(users, reply):
+    store = get_ngram_store()
+    for user in users:
+        store.get_model(user)
+    if reply:
+        get_similarity_index()
+
+def generate_reply(user, prompt, max_words, rng):
+    lemmatized_prompt = lemmatize_text(prompt)
+    similar_message_ids = [
+        message_id for score, message_id in get_similarity_index().query(lemmatized_prompt, user, SIMILAR_MESSAGES)
+    ]
+    return generate_message(user, mode="reply", max_words=max_words, similar_message_ids=similar_message_ids, rng=rng)
+
+def generate_chunk(chunk, max_words=MAX_WORDS):
+    user, mode = chunk["user"], chunk.get("mode", "starter")
+    records = []
+    for index in range(chunk["start"], chunk["start"] + chunk["count"]):
+        rng = random.Random(f"{chunk.get('seed', 0)}:{index}")
+        record = {"job": chunk["job"], "index": index, "user": user, "mode": mode, "seed": chunk.get("seed", 0)}
+        if mode == "reply":
+            prompt = chunk.get("prompt")
+            if prompt is None:
+                prompt, _ = generate_message(chunk.get("reply_to", user), mode="starter", max_words=max_words, rng=rng)
+            record["prompt"] = prompt
+            message, lemmatized = generate_reply(user, prompt, max_words, rng)
+        else:
+            message, lemmatized = generate_message(user, mode=mode, max_words=max_words, rng=rng)
+        record["message"] = message
+        record["lemmatized"] = lemmatized
+        records.append(record)
+    return records
+
+def write_records(output, records):
+    for record in records:
+        output.write(json.dumps(record, ensure_ascii=False) + '\n')
+    output.flush()
+    return len(records)
+
+def run_batch(jobs, output_path=OUTPUT_FILE, workers=os.cpu_count(), chunk_size=BATCH_CHUNK_SIZE, max_words=MAX_WORDS):
+    users = {job["user"] for job in jobs} | {job["reply_to"] for job in jobs if "reply_to" in job}
+    reply = any(job.get("mode") == "reply" for job in jobs)
+    warm_up(users, reply)
+
+    chunks = list(split_jobs(jobs, chunk_size))
+    generate = partial(generate_chunk, max_words=max_words)
+    written = 0
+    with open(output_path, 'w', encoding='utf-8') as output:
+        if workers <= 1:
+            for records in map(generate, chunks):
+                written += write_records(output, records)
+            return written
+
+        context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=context, initializer=warm_up, initargs=(users, reply)
+        ) as pool:
+            for records in pool.map(generate, chunks):
+                written += write_records(output, records)
+    return written
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate many messages across a process pool into a JSONL file.")
+    parser.add_argument('--jobs', help="JSON or JSONL file of {user, mode, count, seed[, prompt, reply_to]} jobs")
+    parser.add_argument('--user')
+    parser.add_argument('--mode', choices=['starter', 'reply'], default='starter')
+    parser.add_argument('--count', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--prompt')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=BATCH_CHUNK_SIZE)
+    parser.add_argument('--max-words', type=int, default=MAX_WORDS)
+    parser.add_argument('--output', default=OUTPUT_FILE)
+    args = parser.parse_args()
+
+    if args.jobs:
+        jobs = load_jobs(args.jobs)
+    elif args.user:
+        jobs = [{"user": args.user, "mode": args.mode, "count": args.count, "seed": args.seed}]
+        if args.prompt is not None:
+            jobs[0]["prompt"] = args.prompt
+    else:
+        parser.error("either --jobs or --user is required")
+
+    written = run_batch(jobs, args.output, args.workers, args.chunk_size, args.max_words)
+    print(f"Generated {written} messages, saved to {args.output}.")
@@ -0,0 +1,275 @@
+import argparse
+import asyncio
+import contextlib
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+from build_ngrams import build_ngrams
+from calculate_replies import REPLY_RATE_DECIMALS, filter_and_count_replies
+from cluster_messages import compute_cluster_stats, iter_cluster_records, iter_file_clusters
+from compute_score import compute_inverse_z_scores
+from generate_message import build_transition_table, generate_text
+from lemmatize_data import lemmatize_text
+from lemmatizer import get_lemmatizer
+from merge_raw_data import calculate_reply_matrix, extract_and_merge, write_json
+from send_dispatcher import FakeTransport, SendDispatcher
+from similar_messages import SimilarityIndex, find_similar_messages
+from synthetic_export import write_exports
+from tokenize_data import tokenize_with_regex
+from word_stats import WordStats
+
+BENCHMARK_DIR = "data/benchmarks"
+DEFAULT_SCALES = [2000, 8000, 32000]
+SIMILARITY_QUERIES = 500
+GENERATED_PER_USER = 20
+MAX_WORDS = 25
+IMPORT_TIME_MODULES = ["bot_management", "initialize_cluster", "generate_message", "lemmatize_data", "simulate"]
+IMPORT_TIME_BUDGET_SECONDS = 0.5
+IMPORT_TIME_TOP = 10
+DISPATCH_BOTS = 40
+DISPATCH_MESSAGES_PER_BOT = 60
+DISPATCH_CHATS_PER_BOT = 10
+DISPATCH_SEND_LATENCY = 0.05
+
+def bench_merge(context):
+    context["merged"] = extract_and_merge(context["raw_files"], context["user_ids"])
+    return len(context["merged"])
+
+def bench_tokenize(context):
+    context["tokenized"] = [tokenize_with_regex(message["text"]) for message in context["merged"]]
+    return len(context["tokenized"])
+
+def bench_lemmatize(context):
+    get_lemmatizer().lemmatize_token.cache_clear()
+    context["lemmatized"] = [
+        {"message_id": message["message_id"], "user_id": message["user_id"], "lemmatized": lemmatize_text(message["text"])}
+        for message in context["merged"]
+    ]
+    return len(context["lemmatized"])
+
+def bench_z_score(context):
+    path = os.path.join(context["work_dir"], "word_stats.npz")
+    compute_inverse_z_scores(context["lemmatized"], path)
+    context["word_stats"] = WordStats.load(path)
+    return len(context["lemmatized"])
+
+def bench_similarity(context):
+    index = SimilarityIndex(context["lemmatized"], context["word_stats"])
+    rng = random.Random(0)
+    queries = rng.sample(context["lemmatized"], min(SIMILARITY_QUERIES, len(context["lemmatized"])))
+    users = context["user_ids"]
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for query in queries:
+            find_similar_messages(index, query["lemmatized"], rng.choice(users))
+    return len(queries)
+
+def bench_transition(context):
+    user_ngrams = {}
+    for message, tokens in zip(context["merged"], context["tokenized"]):
+        user_ngrams.setdefault(message["user_id"], []).extend(build_ngrams(tokens, 2) + build_ngrams(tokens, 3))
+    rng = random.Random(0)
+    generated = 0
+    for ngrams in user_ngrams.values():
+        transition_table = build_transition_table(ngrams)
+        for _ in range(GENERATED_PER_USER):
+            generate_text(transition_table, MAX_WORDS, rng)
+            generated += 1
+    return generated
+
+def bench_cluster(context):
+    timestamps, file_starts = [], []
+    for _ in iter_file_clusters(context["raw_files"], timestamps, file_starts):
+        pass
+    compute_cluster_stats(np.asarray(timestamps, dtype=np.int64), file_starts)
+    return len(timestamps)
+
+def bench_reply_matrix(context):
+    write_json(
+        calculate_reply_matrix(context["merged"], set(context["user_ids"])),
+        os.path.join(context["work_dir"], "merged_reply_matrix.json")
+    )
+    clusters = iter_file_clusters(context["raw_files"], [], [])
+    reply_graph = filter_and_count_replies(iter_cluster_records(clusters), set(context["user_ids"]))
+    write_json(reply_graph.to_dict(REPLY_RATE_DECIMALS), os.path.join(context["work_dir"], "reply_matrix.json"))
+    return len(context["merged"])
+
+STAGES = {
+    "merge": bench_merge,
+    "tokenize": bench_tokenize,
+    "lemmatize": bench_lemmatize,
+    "z_score": bench_z_score,
+    "similarity": bench_similarity,
+    "transition": bench_transition,
+    "cluster": bench_cluster,
+    "reply_matrix": bench_reply_matrix
+}
+
+def measure(stage, context, trace_memory=True):
+    started = time.perf_counter()
+    items = STAGES[stage](context)
+    seconds = time.perf_counter() - started
+    entry = {
+        "messages": context["messages"],
+        "items": items,
+        "seconds": round(seconds, 6),
+        "items_per_second": round(items / seconds, 1) if seconds else None
+    }
+    if trace_memory:
+        tracemalloc.start()
+        STAGES[stage](context)
+        entry["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 2)
+        tracemalloc.stop()
+    return entry
+
+def scaling_exponent(points):
+    points = [(point["messages"], point["seconds"]) for point in points if point["seconds"] > 0]
+    if len(points) < 2:
+        return None
+    messages, seconds = np.log([point[0] for point in points]), np.log([point[1] for point in points])
+    return round(float(np.polyfit(messages, seconds, 1)[0]), 3)
+
+def measure_import_time(module, top=IMPORT_TIME_TOP, budget=IMPORT_TIME_BUDGET_SECONDS):
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'], capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    imports = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        imports.append((name.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6))
+    seconds = next(cumulative for name, _, cumulative in reversed(imports) if name == module)
+    return {
+        "module": module,
+        "seconds": round(seconds, 6),
+        "within_budget": seconds <= budget,
+        "slowest": [
+            {"module": name, "self_seconds": round(self_seconds, 6), "cumulative_seconds": round(cumulative, 6)}
+            for name, self_seconds, cumulative in sorted(imports, key=lambda item: item[1], reverse=True)[:top]
+        ]
+    }
+
+def run_import_report(modules=IMPORT_TIME_MODULES, budget=IMPORT_TIME_BUDGET_SECONDS):
+    report = []
+    for module in modules:
+        entry = measure_import_time(module, budget=budget)
+        report.append(entry)
+        status = "ok" if entry["within_budget"] else f"over the {budget}s budget"
+        print(f"[import] {module}: {entry['seconds']:.3f}s ({status})")
+    return report
+
+async def dispatch_messages(bots, messages_per_bot, chats_per_bot, send_latency):
+    dispatcher = SendDispatcher(FakeTransport(range(1, bots + 1), latency=send_latency))
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        await asyncio.gather(*(
+            dispatcher.submit(user_id, message % chats_per_bot, f"message {message}")
+            for message in range(messages_per_bot)
+            for user_id in range(1, bots + 1)
+        ))
+        stats = dispatcher.stats()
+        await dispatcher.close()
+    return stats
+
+def run_dispatcher_benchmark(bots=DISPATCH_BOTS, messages_per_bot=DISPATCH_MESSAGES_PER_BOT,
+                             chats_per_bot=DISPATCH_CHATS_PER_BOT, send_latency=DISPATCH_SEND_LATENCY):
+    stats = asyncio.run(dispatch_messages(bots, messages_per_bot, chats_per_bot, send_latency))
+    entry = {
+        "bots": bots,
+        "messages": bots * messages_per_bot,
+        "chats_per_bot": chats_per_bot,
+        "send_latency": send_latency,
+        "sent": stats["sent"],
+        "failed": stats["failed"],
+        "messages_per_second": round(stats["messages_per_second"], 1),
+        "latency_p50": round(stats["latency_p50"], 6),
+        "latency_p99": round(stats["latency_p99"], 6)
+    }
+    print(
+        f"[dispatcher] {bots} bots, {entry['messages']} messages: {entry['messages_per_second']} msgs/s, "
+        f"p50 {entry['latency_p50']:.3f}s, p99 {entry['latency_p99']:.3f}s"
+    )
+    return entry
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(scales=DEFAULT_SCALES, users=20, chats=4, link_density=0.05, mention_density=0.05,
+                   reply_density=0.3, seed=0, stages=tuple(STAGES), trace_memory=True,
+                   import_budget=IMPORT_TIME_BUDGET_SECONDS, dispatch_bots=DISPATCH_BOTS,
+                   dispatch_messages=DISPATCH_MESSAGES_PER_BOT, dispatch_latency=DISPATCH_SEND_LATENCY):
+    imports = run_import_report(budget=import_budget) if import_budget else None
+    results = {stage: [] for stage in stages}
+    for messages in scales:
+        with tempfile.TemporaryDirectory() as work_dir:
+            raw_files, user_ids = write_exports(
+                work_dir, users, messages, chats, link_density=link_density,
+                mention_density=mention_density, reply_density=reply_density, seed=seed
+            )
+            context = {"work_dir": work_dir, "raw_files": raw_files, "user_ids": user_ids, "messages": messages}
+            for stage in STAGES:
+                if stage in stages:
+                    entry = measure(stage, context, trace_memory)
+                    results[stage].append(entry)
+                    print(f"[{stage}] {messages} messages: {entry['seconds']:.3f}s, {entry['items_per_second']} items/s")
+                else:
+                    STAGES[stage](context)
+    dispatcher = run_dispatcher_benchmark(dispatch_bots, dispatch_messages, send_latency=dispatch_latency) if dispatch_bots else None
+
+    return {
+        "commit": current_commit(),
+        "created": datetime.now().isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "config": {
+            "scales": list(scales), "users": users, "chats": chats, "link_density": link_density,
+            "mention_density": mention_density, "reply_density": reply_density, "seed": seed
+        },
+        "imports": imports,
+        "stages": results,
+        "dispatcher": dispatcher,
+        "scaling": {stage: scaling_exponent(points) for stage, points in results.items()}
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the offline pipeline and runtime hot paths on synthetic exports.")
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES, help="message counts to benchmark")
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--chats', type=int, default=4)
+    parser.add_argument('--link-density', type=float, default=0.05)
+    parser.add_argument('--mention-density', type=float, default=0.05)
+    parser.add_argument('--reply-density', type=float, default=0.3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES))
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc pass for each stage")
+    parser.add_argument('--import-budget', type=float, default=IMPORT_TIME_BUDGET_SECONDS,
+                        help="seconds allowed per runtime module import; 0 skips the import report")
+    parser.add_argument('--dispatch-bots', type=int, default=DISPATCH_BOTS,
+                        help="bots sending through the send dispatcher; 0 skips the dispatcher scenario")
+    parser.add_argument('--dispatch-messages', type=int, default=DISPATCH_MESSAGES_PER_BOT, help="messages per bot")
+    parser.add_argument('--dispatch-latency', type=float, default=DISPATCH_SEND_LATENCY,
+                        help="simulated seconds per Telegram API call")
+    parser.add_argument('--output', help=f"defaults to {BENCHMARK_DIR}/<commit>.json")
+    args = parser.parse_args()
+
+    report = run_benchmarks(
+        args.scales, args.users, args.chats, args.link_density, args.mention_density,
+        args.reply_density, args.seed, args.stages, not args.no_memory, args.import_budget,
+        args.dispatch_bots, args.dispatch_messages, args.dispatch_latency
+    )
+    output = args.output or os.path.join(BENCHMARK_DIR, f"{report['commit'] or 'benchmark'}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    write_json(report, output)
+    print(f"Benchmark results saved to {output}.")
@@ -1,44 +1,177 @@
+import argparse
 import json
 import asyncio
 import logging
-from aiogram import Bot
-from initialize_cluster import simulate_cluster_conversation
-
-
-with open('data/configs/config.json', 'r') as file:
-    BOT_CONFIGS = json.load(file)
+import multiprocessing
+import os
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web
+import metrics
+from cluster_sampler import get_cluster_sampler
+from corpus_format import (
+    CORPUS_DIR, LEMMATIZED_INPUT_FILE, TOKENIZED_INPUT_FILE, convert_json, corpus_files, corpus_is_fresh
+)
+from initialize_cluster import simulate_cluster_conversation_async
+from message_buffer import MessageBuffer
+from ngram_store import build_transition_tables
+from send_dispatcher import BOT_MESSAGES_PER_SECOND, AiogramTransport, SendDispatcher
+from similar_messages import build_similarity_arrays, similarity_arrays_fresh
+from transition_model import transition_tables_fresh
 
+BOT_CONFIG_FILE = 'data/configs/config.json'
 GROUP_CHAT_ID = -1002311774343
+GROUP_CHAT_IDS = [GROUP_CHAT_ID]
+GENERATION_WORKERS = 4
+CHAT_WORKERS = 1
+BOT_API_SERVER = None
+METRICS_SNAPSHOT_FILE = 'data/bot_metrics.json'
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = None
 logging.basicConfig(level=logging.INFO)
 
-async def bot_send_message(bot: Bot, user_id, message_text):
-    try:
-        await bot.send_message(GROUP_CHAT_ID, message_text)
-        print(f"[DEBUG] Bot {user_id}: Sending message: {message_text}")
-    except Exception as e:
-        print(f"[ERROR] Failed to send message: {e}")
-
-async def main():
-    print("[DEBUG] Starting main bot process.")
-    bots = {config['user_id']: Bot(token=config['api_token']) for config in BOT_CONFIGS}
-    conversation_data = simulate_cluster_conversation()
+def load_bot_configs(path=BOT_CONFIG_FILE):
+    with open(path, 'r') as file:
+        return json.load(file)
 
-    for message_data in conversation_data:
+async def run_chat(chat_id, dispatcher, executor, buffer=None):
+    print(f"[DEBUG] Starting conversation in chat {chat_id}.")
+    async for message_data in simulate_cluster_conversation_async(executor, buffer):
         user_id = message_data['from']
         message_text = message_data['message']
-        
-        if user_id in bots:
-            bot = bots[user_id]
-            await bot_send_message(bot, user_id, message_text)
-    await asyncio.sleep(1)
 
-    for bot in bots.values():
-        await bot.session.close()
-        print(f"[DEBUG] Bot session closed.")
+        if user_id in dispatcher.transport:
+            await dispatcher.send(user_id, chat_id, message_text)
+
+async def write_metrics_snapshots(path, interval=metrics.SNAPSHOT_INTERVAL_SECONDS):
+    while True:
+        await asyncio.sleep(interval)
+        metrics.metrics.write_snapshot(path)
+
+async def start_metrics_server(port, host=METRICS_HOST):
+    async def handle_metrics(request):
+        return web.json_response(metrics.metrics.snapshot())
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"[DEBUG] Metrics available at http://{host}:{port}/metrics.")
+    return runner
+
+async def main(chat_ids=GROUP_CHAT_IDS, transport=None, metrics_file=METRICS_SNAPSHOT_FILE, metrics_port=METRICS_PORT,
+               profile_path=None, profile_on_start=False, bot_rate=BOT_MESSAGES_PER_SECOND):
+    print("[DEBUG] Starting main bot process.")
+    loop = asyncio.get_running_loop()
+    snapshots = asyncio.create_task(write_metrics_snapshots(metrics_file)) if metrics_file else None
+    metrics_server = await start_metrics_server(metrics_port) if metrics_port else None
+    profiler = metrics.SamplingProfiler(profile_path) if profile_path else None
+    if profiler:
+        loop.add_signal_handler(signal.SIGUSR1, profiler.toggle)
+        print("[DEBUG] Send SIGUSR1 to start or stop the sampling profiler.")
+        if profile_on_start:
+            profiler.start()
+
+    if transport is None:
+        transport = AiogramTransport(load_bot_configs(), api_server_url=BOT_API_SERVER)
+    dispatcher = SendDispatcher(transport, bot_rate=bot_rate)
+    executor = ThreadPoolExecutor(max_workers=GENERATION_WORKERS)
+    buffer = MessageBuffer(executor)
+    sampler = await loop.run_in_executor(executor, get_cluster_sampler)
+    buffer.prefill(sampler.starter_users())
+
+    try:
+        await asyncio.gather(*(run_chat(chat_id, dispatcher, executor, buffer) for chat_id in chat_ids))
+    finally:
+        print(f"[DEBUG] Message buffer stats: {buffer.stats()}")
+        buffer.close()
+        executor.shutdown(wait=False, cancel_futures=True)
+        print(f"[DEBUG] Dispatcher stats: {dispatcher.stats()}")
+        await dispatcher.close()
+        if profiler:
+            loop.remove_signal_handler(signal.SIGUSR1)
+            profiler.stop()
+        if snapshots:
+            snapshots.cancel()
+            metrics.metrics.write_snapshot(metrics_file)
+        if metrics_server:
+            await metrics_server.cleanup()
+
+def shard_chats(chat_ids, workers):
+    return [shard for shard in (chat_ids[index::workers] for index in range(workers)) if shard]
+
+def worker_path(path, index):
+    if not path:
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}.{index}{extension}"
+
+def run_worker(index, chat_ids, workers, metrics_file, metrics_port, profile_path, profile_on_start):
+    print(f"[DEBUG] Worker {index} (pid {os.getpid()}) owns chats {chat_ids}.")
+    try:
+        asyncio.run(main(
+            chat_ids, metrics_file=worker_path(metrics_file, index),
+            metrics_port=metrics_port + index if metrics_port else None,
+            profile_path=worker_path(profile_path, index), profile_on_start=profile_on_start,
+            bot_rate=BOT_MESSAGES_PER_SECOND / workers
+        ))
+    except KeyboardInterrupt:
+        pass
+
+def prepare_shared_models():
+    if not (corpus_is_fresh(TOKENIZED_INPUT_FILE) and corpus_is_fresh(LEMMATIZED_INPUT_FILE)):
+        count = convert_json(TOKENIZED_INPUT_FILE, LEMMATIZED_INPUT_FILE, CORPUS_DIR)
+        print(f"[DEBUG] Rebuilt the binary corpus with {count} messages.")
+    if not similarity_arrays_fresh():
+        print(f"[DEBUG] Built shared similarity index with {build_similarity_arrays()} postings.")
+    if not transition_tables_fresh([TOKENIZED_INPUT_FILE, *corpus_files()]):
+        print(f"[DEBUG] Built shared transition tables with {build_transition_tables()} prefixes.")
+
+def run_supervisor(chat_ids, workers, metrics_file=METRICS_SNAPSHOT_FILE, metrics_port=METRICS_PORT,
+                   profile_path=None, profile_on_start=False):
+    prepare_shared_models()
+    context = multiprocessing.get_context('spawn')
+    processes = [
+        context.Process(
+            target=run_worker, name=f"chat-worker-{index}",
+            args=(index, shard, workers, metrics_file, metrics_port, profile_path, profile_on_start)
+        )
+        for index, shard in enumerate(shard_chats(chat_ids, workers))
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        raise
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the chat bots.")
+    parser.add_argument('--chat-ids', type=int, nargs='+', default=GROUP_CHAT_IDS)
+    parser.add_argument('--workers', type=int, default=CHAT_WORKERS, help="processes to shard the chats across")
+    parser.add_argument('--metrics-file', default=METRICS_SNAPSHOT_FILE, help="periodic JSON metrics snapshot")
+    parser.add_argument('--metrics-port', type=int, default=METRICS_PORT, help="serve GET /metrics on this port")
+    parser.add_argument('--profile', help="write sampled stacks here; SIGUSR1 toggles sampling")
+    parser.add_argument('--profile-on-start', action='store_true')
+    args = parser.parse_args()
+
     logging.basicConfig(level=logging.INFO)
     try:
-        asyncio.run(main())
+        if args.workers > 1:
+            run_supervisor(
+                args.chat_ids, args.workers, args.metrics_file, args.metrics_port,
+                args.profile, args.profile_on_start
+            )
+        else:
+            asyncio.run(main(
+                args.chat_ids, metrics_file=args.metrics_file, metrics_port=args.metrics_port,
+                profile_path=args.profile, profile_on_start=args.profile_on_start
+            ))
     except KeyboardInterrupt:
         print('Exit.')
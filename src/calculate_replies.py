@@ -1,56 +1,55 @@
 import json
-from collections import defaultdict
+from filter_selected_users import iter_filtered_clusters, load_selected_user_ids
+from reply_graph import ReplyGraph
+from telegram_stream import iter_array_items, iter_saved_items
 
-INPUT_FILE = "data/filtered_clustered_messages.json"
+CONFIG_PATH = "data/configs/config.json"
+INPUT_FILE = "data/clustered_messages.json"
+FILTERED_FILE = "data/filtered_clustered_messages.json"
 OUTPUT_FILE = "data/reply_matrix.json"
+REPLY_RATE_DECIMALS = 3
 
-def load_filtered_messages(input_file):
-    with open(input_file, 'r', encoding='utf-8') as f:
-        return json.load(f)
+def count_cluster_replies(clusters, graph=None, message_lookup=None):
+    graph = graph if graph is not None else ReplyGraph()
+    message_lookup = message_lookup if message_lookup is not None else {}
+    pending_replies = []
 
-def calculate_reply_matrix(data):
-    reply_counts = defaultdict(lambda: defaultdict(int))
-    total_messages = defaultdict(int)
-    
-    message_lookup = {}
-    for cluster in data["clusters"]:
-        for message in cluster["messages"]:
-            if message["type"] == "message":
-                message_lookup[message["id"]] = message
-
-    for cluster in data["clusters"]:
+    for cluster in clusters:
         for message in cluster["messages"]:
             if message["type"] != "message":
                 continue
 
             user_id = message["from_id"]
-            total_messages[user_id] += 1
-
+            message_lookup[message["id"]] = user_id
+            graph.add_message(user_id)
             if "reply_to_message_id" in message:
-                replied_message_id = message["reply_to_message_id"]
-                if replied_message_id in message_lookup:
-                    replied_user_id = message_lookup[replied_message_id]["from_id"]
-                    reply_counts[user_id][replied_user_id] += 1
-
-    reply_matrix = {
-        user: {
-            replied_user: round(reply_counts[user][replied_user] / total_messages[user], 3)
-            if total_messages[user] > 0 else 0.0
-            for replied_user in total_messages
-        }
-        for user in total_messages
-    }
-    
-    return reply_matrix
+                pending_replies.append((user_id, message["reply_to_message_id"]))
+
+    for user_id, replied_message_id in pending_replies:
+        if replied_message_id in message_lookup:
+            graph.add_reply(user_id, message_lookup[replied_message_id])
+    return graph
+
+def count_replies(data, graph=None, message_lookup=None):
+    return count_cluster_replies(data["clusters"], graph, message_lookup)
+
+def filter_and_count_replies(clusters, selected_user_ids, filtered_file=None, graph=None):
+    filtered_clusters = iter_filtered_clusters(clusters, selected_user_ids)
+    if filtered_file:
+        filtered_clusters = iter_saved_items(filtered_clusters, filtered_file, "clusters")
+    return count_cluster_replies(filtered_clusters, graph)
+
+def calculate_reply_matrix(data):
+    return count_replies(data).to_dict(REPLY_RATE_DECIMALS)
 
 def save_reply_matrix(reply_matrix, output_file):
     with open(output_file, 'w', encoding='utf-8') as f:
         json.dump(reply_matrix, f, ensure_ascii=False, indent=1)
 
 def main():
-    filtered_data = load_filtered_messages(INPUT_FILE)
-    reply_matrix = calculate_reply_matrix(filtered_data)
-    save_reply_matrix(reply_matrix, OUTPUT_FILE)
+    selected_user_ids = load_selected_user_ids(CONFIG_PATH)
+    reply_graph = filter_and_count_replies(iter_array_items(INPUT_FILE, "clusters"), selected_user_ids, FILTERED_FILE)
+    save_reply_matrix(reply_graph.to_dict(REPLY_RATE_DECIMALS), OUTPUT_FILE)
     print(f"Reply matrix has been saved to {OUTPUT_FILE}.")
 
 if __name__ == "__main__":
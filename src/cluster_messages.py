@@ -1,6 +1,9 @@
 import json
 import os
+from array import array
 from datetime import datetime, timedelta
+import numpy as np
+from telegram_stream import REORDER_WINDOW, chat_key, iter_messages, sorted_within_window
 
 RAW_DATA_DIR = "data/raw/"
 OUTPUT_DIR = "data/"
@@ -10,83 +13,173 @@ CLUSTER_TIME_GAP = timedelta(minutes=15)
 MAX_CLUSTER_SIZE = 250
 REDISTRIBUTION_STEP = 0.0001
 MAX_CLUSTER_DELAY_SECONDS = 86400
+EPOCH = datetime(1970, 1, 1)
 
-def load_raw_data(file_path):
-    with open(file_path, 'r', encoding='utf-8') as f:
-        return json.load(f)
-
-def process_messages(raw_data):
-    messages = []
-    for message in raw_data["messages"]:
-        if "date" in message and "text" in message:
-            timestamp = datetime.strptime(message["date"], '%Y-%m-%dT%H:%M:%S')
-            text = message["text"]
-            messages.append((timestamp, message))
-    return sorted(messages, key=lambda x: x[0])
-
-def cluster_messages(messages):
-    clusters = []
-    current_cluster = [messages[0][1]]
-    for i in range(1, len(messages)):
-        if messages[i][0] - messages[i - 1][0] > CLUSTER_TIME_GAP:
-            clusters.append(current_cluster)
-            current_cluster = [messages[i][1]]
-        else:
-            current_cluster.append(messages[i][1])
+def parse_timestamp(date):
+    return int((datetime.fromisoformat(date) - EPOCH).total_seconds())
+
+def iter_timestamped_messages(messages, window=REORDER_WINDOW):
+    return sorted_within_window(
+        (message for message in messages if "date" in message and "text" in message),
+        lambda message: parse_timestamp(message["date"]),
+        window
+    )
+
+def record_timestamps(messages, timestamps):
+    for timestamp, message in messages:
+        timestamps.append(timestamp)
+        yield timestamp, message
+
+def iter_clusters(messages, gap_seconds=CLUSTER_TIME_GAP.total_seconds()):
+    current_cluster = []
+    previous_timestamp = None
+    for timestamp, message in messages:
+        if current_cluster and timestamp - previous_timestamp > gap_seconds:
+            yield current_cluster
+            current_cluster = []
+        current_cluster.append(message)
+        previous_timestamp = timestamp
     if current_cluster:
-        clusters.append(current_cluster)
-    return clusters
+        yield current_cluster
 
-def save_clustered_messages_to_json(clusters, output_file):
-    clustered_data = {
-        "clusters": []
-    }
-    cluster_id = 1
-    
-    for cluster in clusters:
-        clustered_messages = []
-        for message in cluster:
-            message_data = {
+def iter_file_clusters(raw_files, timestamps, file_starts):
+    for raw_file in raw_files:
+        file_starts.append(len(timestamps))
+        header = {}
+        messages = iter_timestamped_messages(iter_messages(raw_file, header))
+        for cluster in iter_clusters(record_timestamps(messages, timestamps)):
+            yield chat_key(header, raw_file), cluster
+
+def load_timeline(raw_files):
+    timestamps = array('q')
+    file_starts = []
+    for raw_file in raw_files:
+        file_starts.append(len(timestamps))
+        timestamps.extend(timestamp for timestamp, _ in iter_timestamped_messages(iter_messages(raw_file)))
+    return np.array(timestamps, dtype=np.int64), np.asarray(file_starts, dtype=np.int64)
+
+def compute_cluster_stats(
+    timestamps,
+    file_starts=(0,),
+    gap_seconds=CLUSTER_TIME_GAP.total_seconds(),
+    max_cluster_size=MAX_CLUSTER_SIZE,
+    max_cluster_delay=MAX_CLUSTER_DELAY_SECONDS
+):
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    message_count = len(timestamps)
+    stats = new_cluster_stats(max_cluster_size)
+    if not message_count:
+        return stats
+
+    boundaries = np.zeros(message_count, dtype=bool)
+    boundaries[1:] = np.diff(timestamps) > gap_seconds
+    file_starts = np.asarray(file_starts, dtype=np.int64)
+    boundaries[file_starts[file_starts < message_count]] = True
+    boundaries[0] = True
+
+    starts = np.flatnonzero(boundaries)
+    ends = np.append(starts[1:], message_count) - 1
+    lengths = ends - starts + 1
+    capped_lengths = np.minimum(lengths, max_cluster_size)
+    bins = max_cluster_size + 1
+
+    multi = lengths > 1
+    avg_delays = (timestamps[ends[multi]] - timestamps[starts[multi]]) / (lengths[multi] - 1)
+    positive_delays = avg_delays[avg_delays > 0]
+    cluster_delays = np.minimum(timestamps[starts[1:]] - timestamps[ends[:-1]], max_cluster_delay)
+
+    stats["length_counts"] = np.bincount(capped_lengths, minlength=bins).tolist()
+    stats["excess_clusters"] = int(np.count_nonzero(lengths > max_cluster_size))
+    stats["message_delay_sums"] = np.bincount(capped_lengths[multi], weights=avg_delays, minlength=bins).tolist()
+    stats["message_delay_counts"] = np.bincount(capped_lengths[multi], minlength=bins).tolist()
+    stats["positive_delay_sum"] = float(positive_delays.sum())
+    stats["positive_delay_count"] = int(len(positive_delays))
+    stats["cluster_delay_sums"] = np.bincount(capped_lengths[1:], weights=cluster_delays, minlength=bins).tolist()
+    stats["cluster_delay_counts"] = np.bincount(capped_lengths[1:], minlength=bins).tolist()
+    return stats
+
+def build_cluster_record(cluster, cluster_id, chat_id):
+    return {
+        "cluster_id": cluster_id,
+        "chat_id": chat_id,
+        "messages": [
+            {
                 "id": message["id"],
                 "cluster_id": cluster_id,
                 **{key: message[key] for key in message if key != "id" and key != "cluster_id"}
             }
-            clustered_messages.append(message_data)
-        
-        clustered_data["clusters"].append({
-            "cluster_id": cluster_id,
-            "messages": clustered_messages
-        })
-        cluster_id += 1
-    
+            for message in cluster
+        ]
+    }
+
+def iter_cluster_records(clusters):
+    for cluster_id, (chat_id, cluster) in enumerate(clusters, 1):
+        yield build_cluster_record(cluster, cluster_id, chat_id)
+
+def iter_saved_clusters(clusters, output_file):
     with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(clustered_data, f, ensure_ascii=False, indent=1)
-
-def calculate_cluster_length_probabilities(clusters):
-    cluster_lengths = [min(len(cluster), MAX_CLUSTER_SIZE) for cluster in clusters]
-    max_length = MAX_CLUSTER_SIZE
-    total_clusters = len(cluster_lengths)
-    length_counts = {i: 0 for i in range(1, max_length + 1)}
-    length_delays = {i: [] for i in range(1, max_length + 1)}
-    
-    for cluster in clusters:
-        cluster_length = min(len(cluster), MAX_CLUSTER_SIZE)
-        length_counts[cluster_length] += 1
-        if len(cluster) > 1:
-            total_delay = 0
-            for i in range(1, len(cluster)):
-                delay = (datetime.strptime(cluster[i]["date"], '%Y-%m-%dT%H:%M:%S') - datetime.strptime(cluster[i - 1]["date"], '%Y-%m-%dT%H:%M:%S')).total_seconds()
-                total_delay += delay
-            avg_delay = total_delay / (len(cluster) - 1)
-            length_delays[cluster_length].append(avg_delay)
-    
-    length_probabilities = {length: count / total_clusters for length, count in length_counts.items()}
-    excess_clusters = sum(1 for cluster in clusters if len(cluster) > MAX_CLUSTER_SIZE)
-    excess_probability = excess_clusters / total_clusters
-    length_probabilities[MAX_CLUSTER_SIZE] -= excess_probability
-    current_length = MAX_CLUSTER_SIZE
+        f.write('{\n "clusters": [')
+        cluster_id = 0
+        for cluster_id, (chat_id, cluster) in enumerate(clusters, 1):
+            record = json.dumps(build_cluster_record(cluster, cluster_id, chat_id), ensure_ascii=False, indent=1)
+            f.write(',\n' if cluster_id > 1 else '\n')
+            f.write('\n'.join('  ' + line for line in record.split('\n')))
+            yield chat_id, cluster
+        f.write('\n ]\n}' if cluster_id else ']\n}')
+
+def save_clustered_messages_to_json(clusters, output_file):
+    for _ in iter_saved_clusters(clusters, output_file):
+        pass
+
+def new_cluster_stats(max_cluster_size=MAX_CLUSTER_SIZE):
+    return {
+        "length_counts": [0] * (max_cluster_size + 1),
+        "excess_clusters": 0,
+        "message_delay_sums": [0.0] * (max_cluster_size + 1),
+        "message_delay_counts": [0] * (max_cluster_size + 1),
+        "positive_delay_sum": 0.0,
+        "positive_delay_count": 0,
+        "cluster_delay_sums": [0.0] * (max_cluster_size + 1),
+        "cluster_delay_counts": [0] * (max_cluster_size + 1)
+    }
+
+def add_cluster_to_stats(stats, length, first_timestamp, last_timestamp, previous_cluster_end=None,
+                         max_cluster_delay=MAX_CLUSTER_DELAY_SECONDS):
+    max_cluster_size = len(stats["length_counts"]) - 1
+    cluster_length = min(length, max_cluster_size)
+    stats["length_counts"][cluster_length] += 1
+    if length > max_cluster_size:
+        stats["excess_clusters"] += 1
+    if length > 1:
+        avg_delay = (last_timestamp - first_timestamp) / (length - 1)
+        stats["message_delay_sums"][cluster_length] += avg_delay
+        stats["message_delay_counts"][cluster_length] += 1
+        if avg_delay > 0:
+            stats["positive_delay_sum"] += avg_delay
+            stats["positive_delay_count"] += 1
+    if previous_cluster_end is not None:
+        delay_between_clusters = min(first_timestamp - previous_cluster_end, max_cluster_delay)
+        stats["cluster_delay_sums"][cluster_length] += delay_between_clusters
+        stats["cluster_delay_counts"][cluster_length] += 1
+
+def calculate_cluster_length_probabilities(stats, redistribution_step=REDISTRIBUTION_STEP):
+    max_cluster_size = len(stats["length_counts"]) - 1
+    total_clusters = sum(stats["length_counts"])
+    length_probabilities = {
+        length: stats["length_counts"][length] / total_clusters
+        for length in range(1, max_cluster_size + 1)
+    }
+    length_delays = {
+        length: [stats["message_delay_sums"][length] / stats["message_delay_counts"][length]]
+        if stats["message_delay_counts"][length] else []
+        for length in range(1, max_cluster_size + 1)
+    }
+
+    excess_probability = stats["excess_clusters"] / total_clusters
+    length_probabilities[max_cluster_size] -= excess_probability
+    current_length = max_cluster_size
     while excess_probability > 0 and current_length >= 1:
-        to_add = min(REDISTRIBUTION_STEP, excess_probability)
+        to_add = min(redistribution_step, excess_probability)
         length_probabilities[current_length] += to_add
         excess_probability -= to_add
         current_length -= 1
@@ -97,18 +190,15 @@ def calculate_average_delay(delays):
         return 0
     return sum(delays) / len(delays)
 
-def calculate_global_average_delay(length_delays):
-    valid_delays = []
-    for delays in length_delays.values():
-        valid_delays.extend([delay for delay in delays if delay > 0])
-    if valid_delays:
-        return sum(valid_delays) / len(valid_delays)
+def calculate_global_average_delay(stats):
+    if stats["positive_delay_count"]:
+        return stats["positive_delay_sum"] / stats["positive_delay_count"]
     return 0
 
 def assign_custom_zeros(length_delays, global_average_delay):
     divisor = 5
     zero_count = 0
-    for length in range(MAX_CLUSTER_SIZE, 0, -1):
+    for length in sorted(length_delays, reverse=True):
         if calculate_average_delay(length_delays[length]) == 0:
             zero_count += 1
             length_delays[length] = [global_average_delay / divisor]
@@ -130,18 +220,16 @@ def smooth_inconsistent_delays(length_delays):
             smoothed_delay = (prev_delay + next_delay) / 2
             length_delays[current_length] = [smoothed_delay]
 
-def calculate_average_cluster_delay(clusters):
-    cluster_delays = {i: [] for i in range(1, MAX_CLUSTER_SIZE + 1)}
-    for i in range(1, len(clusters)):
-        current_cluster_length = min(len(clusters[i]), MAX_CLUSTER_SIZE)
-        delay_between_clusters = (datetime.strptime(clusters[i][0]["date"], '%Y-%m-%dT%H:%M:%S') - datetime.strptime(clusters[i-1][-1]["date"], '%Y-%m-%dT%H:%M:%S')).total_seconds()
-        delay_between_clusters = min(delay_between_clusters, MAX_CLUSTER_DELAY_SECONDS)
-        cluster_delays[current_cluster_length].append(delay_between_clusters)
-    return {length: calculate_average_delay(delays) for length, delays in cluster_delays.items()}
+def calculate_average_cluster_delay(stats):
+    return {
+        length: stats["cluster_delay_sums"][length] / stats["cluster_delay_counts"][length]
+        if stats["cluster_delay_counts"][length] else 0
+        for length in range(1, len(stats["cluster_delay_counts"]))
+    }
 
 def assign_custom_zeros_cluster(cluster_delays, global_avg_cluster_delay):
     divisor = 5
-    for length in range(MAX_CLUSTER_SIZE, 0, -1):
+    for length in sorted(cluster_delays, reverse=True):
         if cluster_delays[length] == 0:
             cluster_delays[length] = global_avg_cluster_delay / divisor
             if divisor > 1:
@@ -162,9 +250,9 @@ def smooth_inconsistent_cluster_delays(cluster_delays):
             smoothed_cluster_delay = (prev_cluster_delay + next_cluster_delay) / 2
             cluster_delays[current_length] = smoothed_cluster_delay
 
-def save_probabilities_to_file(probabilities, delays, cluster_avg_delays, global_average_delay, output_file):
+def build_probability_data(probabilities, delays, cluster_avg_delays):
     message_cluster_data = []
-    for length in range(1, MAX_CLUSTER_SIZE + 1):
+    for length in sorted(probabilities):
         probability = probabilities.get(length, 0)
         avg_message_delay = calculate_average_delay(delays[length])
         avg_cluster_delay = cluster_avg_delays.get(length, 0)
@@ -174,35 +262,36 @@ def save_probabilities_to_file(probabilities, delays, cluster_avg_delays, global
             "avg_cluster_delay": avg_cluster_delay
         })
 
-    output_data = {
+    return {
         "message_cluster_data": message_cluster_data,
         "total_probability": sum(probabilities.values())
     }
 
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(output_data, f, ensure_ascii=False, indent=1)
-
-if __name__ == "__main__":
-    raw_files = ["course_2.json", "course_3.json", "course_4.json", "delivery.json"]
-    all_clusters = []
-    for raw_file in raw_files:
-        raw_data = load_raw_data(os.path.join(RAW_DATA_DIR, raw_file))
-        messages = process_messages(raw_data)
-        clusters = cluster_messages(messages)
-        all_clusters.extend(clusters)
-
-    save_clustered_messages_to_json(all_clusters, OUTPUT_CLUSTERED_MESSAGES_FILE)
-
-    cluster_probabilities, cluster_delays = calculate_cluster_length_probabilities(all_clusters)
-    global_avg_delay = calculate_global_average_delay(cluster_delays)
+def build_cluster_data(stats, redistribution_step=REDISTRIBUTION_STEP):
+    cluster_probabilities, cluster_delays = calculate_cluster_length_probabilities(stats, redistribution_step)
+    global_avg_delay = calculate_global_average_delay(stats)
     assign_custom_zeros(cluster_delays, global_avg_delay)
     smooth_inconsistent_delays(cluster_delays)
-    cluster_avg_delays = calculate_average_cluster_delay(all_clusters)
-    
-    global_avg_cluster_delay = sum(cluster_avg_delays.values()) / len([v for v in cluster_avg_delays.values() if v > 0])
+    cluster_avg_delays = calculate_average_cluster_delay(stats)
+
+    global_avg_cluster_delay = sum(cluster_avg_delays.values()) / max(1, len([v for v in cluster_avg_delays.values() if v > 0]))
     assign_custom_zeros_cluster(cluster_avg_delays, global_avg_cluster_delay)
     smooth_inconsistent_cluster_delays(cluster_avg_delays)
 
-    save_probabilities_to_file(cluster_probabilities, cluster_delays, cluster_avg_delays, global_avg_delay, OUTPUT_PROBABILITY_FILE)
+    return build_probability_data(cluster_probabilities, cluster_delays, cluster_avg_delays)
+
+def process_cluster_stats(stats, output_file):
+    temp_file = f"{output_file}.tmp"
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(build_cluster_data(stats), f, ensure_ascii=False, indent=1)
+    os.replace(temp_file, output_file)
+
+if __name__ == "__main__":
+    raw_files = ["course_2.json", "course_3.json", "course_4.json", "delivery.json"]
+    timestamps = array('q')
+    file_starts = []
+    all_clusters = iter_file_clusters([os.path.join(RAW_DATA_DIR, raw_file) for raw_file in raw_files], timestamps, file_starts)
+    save_clustered_messages_to_json(all_clusters, OUTPUT_CLUSTERED_MESSAGES_FILE)
+    process_cluster_stats(compute_cluster_stats(timestamps, file_starts), OUTPUT_PROBABILITY_FILE)
 
     print(f"Clustered data and message cluster probabilities saved to {OUTPUT_DIR}.")
@@ -0,0 +1,118 @@
+import json
+import os
+import random
+import threading
+from reply_graph import ReplyGraph
+
+CLUSTER_DATA_FILE = "data/cluster_data.json"
+STARTER_PROB_FILE = "data/starter_message_probabilities.json"
+CLUSTER_REPLY_FILE = "data/cluster_reply_participation.json"
+MAX_CONVERSATION_LENGTH = 50
+
+_default_sampler = None
+_default_lock = threading.Lock()
+
+def load_json(file_path):
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+class AliasTable:
+    def __init__(self, weights):
+        size = len(weights)
+        total = float(sum(weights))
+        if not size or total <= 0:
+            raise ValueError("Alias table needs at least one positive weight")
+        scaled = [weight * size / total for weight in weights]
+        self.size = size
+        self.probability = [1.0] * size
+        self.alias = list(range(size))
+
+        small = [i for i, value in enumerate(scaled) if value < 1.0]
+        large = [i for i, value in enumerate(scaled) if value >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.probability[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+
+    def sample(self, rng=random):
+        position = rng.random() * self.size
+        column = int(position)
+        if column == self.size:
+            column -= 1
+        return column if position - column < self.probability[column] else self.alias[column]
+
+class ClusterSampler:
+    def __init__(self, cluster_path=CLUSTER_DATA_FILE, starter_path=STARTER_PROB_FILE,
+                 participation_path=CLUSTER_REPLY_FILE, max_length=MAX_CONVERSATION_LENGTH):
+        self.paths = (cluster_path, starter_path, participation_path)
+        self.max_length = max_length
+        self.mtimes = None
+        self.tables = None
+        self.reload_if_changed()
+
+    def file_mtimes(self):
+        return tuple(os.stat(path).st_mtime_ns for path in self.paths)
+
+    def reload_if_changed(self):
+        try:
+            mtimes = self.file_mtimes()
+            if mtimes == self.mtimes:
+                return False
+            self.load()
+        except (OSError, ValueError, KeyError) as e:
+            if self.tables is None:
+                raise
+            print(f"[WARNING] Keeping the previous conversation tables, reload failed: {e}")
+            return False
+        self.mtimes = mtimes
+        return True
+
+    def load(self):
+        cluster_path, starter_path, participation_path = self.paths
+        clusters = load_json(cluster_path)["message_cluster_data"]
+        starters = load_json(starter_path)
+        graph = ReplyGraph.from_participation(load_json(participation_path))
+
+        matrix = graph.matrix()
+        next_users = {}
+        for row, user in enumerate(graph.users):
+            start, end = matrix.indptr[row], matrix.indptr[row + 1]
+            weights = matrix.data[start:end].tolist()
+            if sum(weights) > 0:
+                next_users[user] = (
+                    [graph.users[column] for column in matrix.indices[start:end].tolist()],
+                    AliasTable(weights)
+                )
+
+        self.tables = (
+            clusters,
+            AliasTable([cluster['probability'] for cluster in clusters]),
+            starters,
+            AliasTable([user['probability'] for user in starters]),
+            next_users
+        )
+
+    def sample_cluster(self, rng=random):
+        clusters, cluster_table, starters, starter_table, next_users = self.tables
+        return {
+            "cluster": {**clusters[cluster_table.sample(rng)], "length": rng.randint(1, self.max_length)},
+            "starter_user": starters[starter_table.sample(rng)]
+        }
+
+    def next_user(self, user, rng=random):
+        users, table = self.tables[4][user]
+        return users[table.sample(rng)]
+
+    def starter_users(self):
+        return [starter['user_id'] for starter in self.tables[2]]
+
+def get_cluster_sampler():
+    global _default_sampler
+    with _default_lock:
+        if _default_sampler is None:
+            _default_sampler = ClusterSampler()
+        else:
+            _default_sampler.reload_if_changed()
+    return _default_sampler
@@ -0,0 +1,74 @@
+import argparse
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from cluster_messages import (
+    CLUSTER_TIME_GAP, MAX_CLUSTER_DELAY_SECONDS, MAX_CLUSTER_SIZE, RAW_DATA_DIR,
+    REDISTRIBUTION_STEP, build_cluster_data, compute_cluster_stats, load_timeline
+)
+
+OUTPUT_SWEEP_FILE = "data/cluster_sweep.json"
+
+_timeline = None
+
+def _init_worker(timestamps, file_starts):
+    global _timeline
+    _timeline = (timestamps, file_starts)
+
+def evaluate_setting(setting):
+    timestamps, file_starts = _timeline
+    stats = compute_cluster_stats(
+        timestamps,
+        file_starts,
+        setting["gap_seconds"],
+        setting["max_cluster_size"],
+        setting["max_cluster_delay"]
+    )
+    cluster_data = build_cluster_data(stats, setting["redistribution_step"]) if sum(stats["length_counts"]) else None
+    return {
+        "settings": setting,
+        "cluster_count": sum(stats["length_counts"]),
+        "excess_clusters": stats["excess_clusters"],
+        "length_counts": stats["length_counts"][1:],
+        "cluster_data": cluster_data
+    }
+
+def build_settings(gap_minutes, max_cluster_sizes, max_cluster_delays, redistribution_steps):
+    return [
+        {
+            "gap_seconds": gap * 60,
+            "max_cluster_size": max_cluster_size,
+            "max_cluster_delay": max_cluster_delay,
+            "redistribution_step": redistribution_step
+        }
+        for gap, max_cluster_size, max_cluster_delay, redistribution_step in itertools.product(
+            gap_minutes, max_cluster_sizes, max_cluster_delays, redistribution_steps
+        )
+    ]
+
+def run_sweep(raw_files, settings, workers=os.cpu_count()):
+    timestamps, file_starts = load_timeline(raw_files)
+    if workers <= 1:
+        _init_worker(timestamps, file_starts)
+        return [evaluate_setting(setting) for setting in settings]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(timestamps, file_starts)) as pool:
+        return list(pool.map(evaluate_setting, settings))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate many clustering thresholds over one loaded timeline.")
+    parser.add_argument('--gap-minutes', type=float, nargs='+', default=[CLUSTER_TIME_GAP.total_seconds() / 60])
+    parser.add_argument('--max-cluster-size', type=int, nargs='+', default=[MAX_CLUSTER_SIZE])
+    parser.add_argument('--max-cluster-delay', type=int, nargs='+', default=[MAX_CLUSTER_DELAY_SECONDS])
+    parser.add_argument('--redistribution-step', type=float, nargs='+', default=[REDISTRIBUTION_STEP])
+    parser.add_argument('--raw-files', nargs='+', default=["course_2.json", "course_3.json", "course_4.json", "delivery.json"])
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--output', default=OUTPUT_SWEEP_FILE)
+    args = parser.parse_args()
+
+    settings = build_settings(args.gap_minutes, args.max_cluster_size, args.max_cluster_delay, args.redistribution_step)
+    results = run_sweep([os.path.join(RAW_DATA_DIR, raw_file) for raw_file in args.raw_files], settings, args.workers)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=1)
+    print(f"Evaluated {len(results)} clustering settings, results saved to {args.output}.")
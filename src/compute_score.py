@@ -1,32 +1,34 @@
+import argparse
 import json
-import math
 from collections import Counter
+from word_stats import WORD_STATS_FILE, WORD_STATS_TEXT_FILE, WordStats
 
-def compute_mean_and_std(word_counter):
-    total_words = sum(word_counter.values())
-    unique_words = len(word_counter)
-    mean_frequency = total_words / unique_words
-    variance = sum((count - mean_frequency) ** 2 for count in word_counter.values()) / unique_words
-    return mean_frequency, math.sqrt(variance)
+def count_words(lemmatized_data, word_counter=None):
+    word_counter = word_counter if word_counter is not None else Counter()
+    word_counter.update(word for message in lemmatized_data for word in message['lemmatized'])
+    return word_counter
 
-def compute_inverse_z_scores(lemmatized_data, output_inv_zscore):
-    word_counter = Counter(word for message in lemmatized_data for word in message['lemmatized'])
-    mean_freq, std_dev = compute_mean_and_std(word_counter)
-    inverse_z_scores = {word: 1 / (1 + abs((count - mean_freq) / std_dev)) for word, count in word_counter.items()}
+def inverse_z_scores_from_counts(word_counter, output_path=WORD_STATS_FILE, text_path=None):
+    word_stats = WordStats.from_counts(word_counter)
+    word_stats.save(output_path)
+    if text_path:
+        word_stats.write_text(text_path)
+    return word_stats
 
-    with open(output_inv_zscore, 'w', encoding='utf-8') as file:
-        for word, count in word_counter.items():
-            file.write(f"{word}: {count}, Inverse Z-Score: {inverse_z_scores[word]:.4f}\n")
-    return inverse_z_scores
+def compute_inverse_z_scores(lemmatized_data, output_path=WORD_STATS_FILE, text_path=None):
+    return inverse_z_scores_from_counts(count_words(lemmatized_data), output_path, text_path)
 
-def process_z_scores(input_path, inv_zscore_path):
+def process_z_scores(input_path, output_path, text_path=None):
     with open(input_path, 'r', encoding='utf-8') as file:
         lemmatized_data = json.load(file)
-    compute_inverse_z_scores(lemmatized_data, inv_zscore_path)
+    compute_inverse_z_scores(lemmatized_data, output_path, text_path)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute per-word inverse z-scores.")
+    parser.add_argument('--text-export', action='store_true', help=f"also write {WORD_STATS_TEXT_FILE} for inspection")
+    args = parser.parse_args()
+
     input_path = 'data/lemmatized_output.json'
-    inv_zscore_path = 'data/word_inverse_zscore.txt'
-    
-    process_z_scores(input_path, inv_zscore_path)
-    print(f"Word Inverse Z-scores have been saved to {inv_zscore_path}.")
+
+    process_z_scores(input_path, WORD_STATS_FILE, WORD_STATS_TEXT_FILE if args.text_export else None)
+    print(f"Word Inverse Z-scores have been saved to {WORD_STATS_FILE}.")
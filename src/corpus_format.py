@@ -0,0 +1,146 @@
+import json
+import os
+import shutil
+import numpy as np
+
+CORPUS_DIR = 'data/corpus'
+TOKENIZED_INPUT_FILE = 'data/tokenized_output.json'
+LEMMATIZED_INPUT_FILE = 'data/lemmatized_output.json'
+NO_REPLY = -1
+
+COLUMNS = {
+    'message_ids': np.int64,
+    'user_ids': np.int32,
+    'reply_to': np.int64,
+    'tokens': np.int32,
+    'token_offsets': np.int64,
+    'lemmas': np.int32,
+    'lemma_offsets': np.int64,
+    'vocabulary': np.uint8,
+    'vocabulary_offsets': np.int64,
+    'users': np.uint8,
+    'users_offsets': np.int64
+}
+
+def encode_strings(strings):
+    encoded = [string.encode('utf-8') for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(item) for item in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+def decode_strings(data, offsets):
+    raw = data.tobytes()
+    bounds = offsets.tolist()
+    return [raw[bounds[i]:bounds[i + 1]].decode('utf-8') for i in range(len(bounds) - 1)]
+
+def save_arrays(arrays, output_dir):
+    output_dir = output_dir.rstrip(os.sep)
+    temp_dir = f"{output_dir}.tmp-{os.getpid()}"
+    old_dir = f"{output_dir}.old-{os.getpid()}"
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    os.makedirs(temp_dir)
+    for name, array in arrays.items():
+        np.save(os.path.join(temp_dir, f"{name}.npy"), array)
+    if os.path.isdir(output_dir):
+        os.replace(output_dir, old_dir)
+    os.replace(temp_dir, output_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+def write_corpus(messages, output_dir):
+    vocabulary = {}
+    users = {}
+    columns = {name: [] for name in ('message_ids', 'user_ids', 'reply_to', 'tokens', 'lemmas')}
+    columns['token_offsets'] = [0]
+    columns['lemma_offsets'] = [0]
+
+    for message in messages:
+        reply_to = message.get('reply_to')
+        columns['message_ids'].append(message['message_id'])
+        columns['user_ids'].append(users.setdefault(message['user_id'], len(users)))
+        columns['reply_to'].append(NO_REPLY if reply_to is None else reply_to)
+        for key, column in (('tokenized', 'tokens'), ('lemmatized', 'lemmas')):
+            columns[column].extend(vocabulary.setdefault(word, len(vocabulary)) for word in message.get(key, []))
+        columns['token_offsets'].append(len(columns['tokens']))
+        columns['lemma_offsets'].append(len(columns['lemmas']))
+
+    arrays = {name: np.asarray(values, dtype=COLUMNS[name]) for name, values in columns.items()}
+    arrays['vocabulary'], arrays['vocabulary_offsets'] = encode_strings(vocabulary)
+    arrays['users'], arrays['users_offsets'] = encode_strings(users)
+    save_arrays(arrays, output_dir)
+
+class Corpus:
+    def __init__(self, corpus_dir=CORPUS_DIR):
+        self.corpus_dir = corpus_dir
+        self.columns = {
+            name: np.load(os.path.join(corpus_dir, f"{name}.npy"), mmap_mode='r')
+            for name in COLUMNS
+        }
+        self.vocabulary = decode_strings(self.columns['vocabulary'], self.columns['vocabulary_offsets'])
+        self.users = decode_strings(self.columns['users'], self.columns['users_offsets'])
+
+    def __len__(self):
+        return len(self.columns['message_ids'])
+
+    def _words(self, column, index):
+        offsets = self.columns[f"{column[:-1]}_offsets"]
+        ids = self.columns[column][offsets[index]:offsets[index + 1]]
+        return [self.vocabulary[word_id] for word_id in ids.tolist()]
+
+    def tokens(self, index):
+        return self._words('tokens', index)
+
+    def lemmas(self, index):
+        return self._words('lemmas', index)
+
+    def iter_messages(self):
+        vocabulary = self.vocabulary
+        columns = {name: self.columns[name].tolist() for name in ('message_ids', 'user_ids', 'reply_to', 'tokens', 'token_offsets', 'lemmas', 'lemma_offsets')}
+        tokens, token_offsets = columns['tokens'], columns['token_offsets']
+        lemmas, lemma_offsets = columns['lemmas'], columns['lemma_offsets']
+        for index, message_id in enumerate(columns['message_ids']):
+            reply_to = columns['reply_to'][index]
+            yield {
+                'message_id': message_id,
+                'user_id': self.users[columns['user_ids'][index]],
+                'reply_to': None if reply_to == NO_REPLY else reply_to,
+                'tokenized': [vocabulary[i] for i in tokens[token_offsets[index]:token_offsets[index + 1]]],
+                'lemmatized': [vocabulary[i] for i in lemmas[lemma_offsets[index]:lemma_offsets[index + 1]]]
+            }
+
+def file_mtimes(paths):
+    return tuple(os.stat(path).st_mtime_ns if os.path.exists(path) else None for path in paths)
+
+def artifact_fresh(artifact_paths, source_paths):
+    if not all(os.path.exists(path) for path in artifact_paths):
+        return False
+    source_mtimes = [os.stat(path).st_mtime_ns for path in source_paths if os.path.exists(path)]
+    return min(os.stat(path).st_mtime_ns for path in artifact_paths) >= max(source_mtimes, default=0)
+
+def corpus_files(corpus_dir=CORPUS_DIR):
+    return [os.path.join(corpus_dir, f"{name}.npy") for name in COLUMNS]
+
+def corpus_is_fresh(json_path, corpus_dir=CORPUS_DIR):
+    return artifact_fresh(corpus_files(corpus_dir), [json_path])
+
+def load_messages(json_path, corpus_dir=CORPUS_DIR):
+    if os.path.isdir(corpus_dir):
+        if corpus_is_fresh(json_path, corpus_dir):
+            return Corpus(corpus_dir).iter_messages()
+        print(f"[WARNING] {corpus_dir} is older than {json_path}, reading the JSON instead. Rerun corpus_format.py to refresh it.")
+    with open(json_path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+def convert_json(tokenized_path, lemmatized_path, output_dir):
+    with open(tokenized_path, 'r', encoding='utf-8') as file:
+        messages = json.load(file)
+    with open(lemmatized_path, 'r', encoding='utf-8') as file:
+        lemmas = {message['message_id']: message['lemmatized'] for message in json.load(file)}
+
+    for message in messages:
+        message['lemmatized'] = lemmas.get(message['message_id'], [])
+    write_corpus(messages, output_dir)
+    return len(messages)
+
+if __name__ == "__main__":
+    count = convert_json(TOKENIZED_INPUT_FILE, LEMMATIZED_INPUT_FILE, CORPUS_DIR)
+    print(f"Converted {count} messages into the binary corpus at {CORPUS_DIR}.")
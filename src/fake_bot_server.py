@@ -0,0 +1,62 @@
+import argparse
+import time
+from collections import defaultdict, deque
+from aiohttp import web
+
+FAKE_SERVER_HOST = '127.0.0.1'
+FAKE_SERVER_PORT = 8081
+FLOOD_LIMIT_PER_SECOND = 30
+
+
+def create_app(flood_limit=FLOOD_LIMIT_PER_SECOND):
+    recent_sends = defaultdict(deque)
+    counters = {"message_id": 0, "sent": 0, "flooded": 0}
+
+    async def handle_method(request):
+        token, method = request.match_info['token'], request.match_info['method']
+        data = dict(await request.post())
+        if method != 'sendMessage':
+            return web.json_response({"ok": True, "result": True})
+
+        now = time.monotonic()
+        window = recent_sends[token]
+        while window and now - window[0] > 1:
+            window.popleft()
+        if flood_limit and len(window) >= flood_limit:
+            counters["flooded"] += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": "Too Many Requests: retry after 1",
+                "parameters": {"retry_after": 1}
+            })
+        window.append(now)
+
+        counters["message_id"] += 1
+        counters["sent"] += 1
+        return web.json_response({
+            "ok": True,
+            "result": {
+                "message_id": counters["message_id"],
+                "date": int(time.time()),
+                "chat": {"id": int(data.get('chat_id', 0)), "type": "supergroup"},
+                "text": data.get('text', '')
+            }
+        })
+
+    async def handle_stats(request):
+        return web.json_response(counters)
+
+    app = web.Application()
+    app.router.add_get('/stats', handle_stats)
+    app.router.add_post('/bot{token}/{method}', handle_method)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the Telegram Bot API.")
+    parser.add_argument('--host', default=FAKE_SERVER_HOST)
+    parser.add_argument('--port', type=int, default=FAKE_SERVER_PORT)
+    parser.add_argument('--flood-limit', type=int, default=FLOOD_LIMIT_PER_SECOND)
+    args = parser.parse_args()
+    web.run_app(create_app(args.flood_limit), host=args.host, port=args.port)
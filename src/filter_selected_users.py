@@ -1,5 +1,5 @@
 import json
-import os
+from telegram_stream import iter_array_items, iter_saved_items
 
 CONFIG_PATH = "data/configs/config.json"
 INPUT_FILE = "data/clustered_messages.json"
@@ -10,43 +10,47 @@ def load_selected_user_ids(config_path):
         config_data = json.load(f)
     return {entry['user_id'] for entry in config_data}
 
-def load_clustered_messages(input_file):
-    with open(input_file, 'r', encoding='utf-8') as f:
-        return json.load(f)
-
-def filter_clusters_by_users(data, selected_user_ids):
-    filtered_clusters = []
+def is_selected_message(message, selected_user_ids):
+    return (
+        message.get("type") == "message" and
+        (message.get("from_id") in selected_user_ids or message.get("actor_id") in selected_user_ids)
+    )
+
+def renumber_message(message, message_id, message_ids):
+    message_ids[message["id"]] = message_id
+    message["id"] = message_id
+    reply_to = message.pop("reply_to_message_id", None)
+    if reply_to in message_ids:
+        message["reply_to_message_id"] = message_ids[reply_to]
+    return message
+
+def iter_filtered_clusters(clusters, selected_user_ids):
     message_id = 1
-    
-    for cluster in data.get("clusters", []):
+    chat_message_ids = {}
+
+    for cluster in clusters:
         filtered_messages = []
+        message_ids = chat_message_ids.setdefault(cluster.get("chat_id"), {})
         
         for message in cluster["messages"]:
-            if (
-                message.get("type") == "message" and
-                (message.get("from_id") in selected_user_ids or message.get("actor_id") in selected_user_ids)
-            ):
-                message["id"] = message_id
-                filtered_messages.append(message)
+            if is_selected_message(message, selected_user_ids):
+                filtered_messages.append(renumber_message(message, message_id, message_ids))
                 message_id += 1
 
         if filtered_messages:
-            filtered_clusters.append({
+            yield {
                 "cluster_id": cluster["cluster_id"],
                 "messages": filtered_messages
-            })
-    
-    return {"clusters": filtered_clusters}
+            }
 
-def save_filtered_data(output_data, output_file):
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(output_data, f, ensure_ascii=False, indent=1)
+def save_filtered_clusters(clusters, output_file):
+    for _ in iter_saved_items(clusters, output_file, "clusters"):
+        pass
 
 def main():
     selected_user_ids = load_selected_user_ids(CONFIG_PATH)
-    clustered_data = load_clustered_messages(INPUT_FILE)
-    filtered_data = filter_clusters_by_users(clustered_data, selected_user_ids)
-    save_filtered_data(filtered_data, OUTPUT_FILE)
+    clusters = iter_array_items(INPUT_FILE, "clusters")
+    save_filtered_clusters(iter_filtered_clusters(clusters, selected_user_ids), OUTPUT_FILE)
     print(f"Filtered data has been saved to {OUTPUT_FILE}.")
 
 if __name__ == "__main__":
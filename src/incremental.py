@@ -0,0 +1,233 @@
+import copy
+import hashlib
+import json
+import os
+import shutil
+from collections import Counter
+from itertools import chain
+from calculate_replies import OUTPUT_FILE as REPLY_MATRIX_FILE
+from calculate_replies import REPLY_RATE_DECIMALS, count_replies
+from cluster_messages import (
+    CLUSTER_TIME_GAP, OUTPUT_PROBABILITY_FILE, add_cluster_to_stats,
+    new_cluster_stats, parse_timestamp, process_cluster_stats
+)
+from compute_score import count_words, inverse_z_scores_from_counts
+from corpus_format import CORPUS_DIR, convert_json
+from filter_selected_users import is_selected_message, renumber_message
+from lemmatize_data import lemmatize_texts
+from merge_raw_data import REPLY_RATE_DECIMALS as MERGED_REPLY_RATE_DECIMALS
+from merge_raw_data import count_replies as count_merged_replies
+from merge_raw_data import merge_message, read_json, read_user_id, write_json
+from reply_graph import ReplyGraph
+from telegram_stream import chat_key, iter_messages
+from tokenize_data import tokenize_with_regex
+
+STATE_FILE = 'data/incremental_state.json'
+RAW_DATA_DIR = 'data/raw'
+CONFIG_PATH = 'data/configs/config.json'
+MERGED_FILE = 'data/merged/merged.json'
+MERGED_REPLY_MATRIX_FILE = 'data/merged/reply_matrix.json'
+TOKENIZED_FILE = 'data/tokenized_output.json'
+LEMMATIZED_FILE = 'data/lemmatized_output.json'
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def new_state():
+    return {
+        "files": {},
+        "chats": {},
+        "next_message_id": 1,
+        "merged_lookup": {},
+        "merged_reply_counts": {},
+        "merged_totals": {},
+        "next_filtered_id": 1,
+        "filtered_lookup": {},
+        "reply_counts": {},
+        "reply_totals": {},
+        "word_counts": {},
+        "cluster_stats": new_cluster_stats()
+    }
+
+def load_state(state_path):
+    if not os.path.exists(state_path):
+        return None
+    state = read_json(state_path)
+    for key in ("merged_lookup", "filtered_lookup"):
+        state[key] = {int(message_id): user_id for message_id, user_id in state[key].items()}
+    for chat_state in state["chats"].values():
+        for key in ("merged_ids", "filtered_ids"):
+            chat_state[key] = {int(raw_id): message_id for raw_id, message_id in chat_state.get(key, {}).items()}
+    return state
+
+def save_state(state, state_path):
+    temp_path = f"{state_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump(state, file, ensure_ascii=False)
+    os.replace(temp_path, state_path)
+
+def append_json_array(path, items):
+    if not os.path.exists(path):
+        write_json(items, path)
+        return
+    if not items:
+        return
+    body = ',\n'.join(
+        '\n'.join(' ' + line for line in json.dumps(item, ensure_ascii=False, indent=1).split('\n'))
+        for item in items
+    ).encode('utf-8')
+    temp_path = f"{path}.tmp"
+    shutil.copyfile(path, temp_path)
+    with open(temp_path, 'rb+') as file:
+        file.seek(-2, os.SEEK_END)
+        separator = b'[\n' if file.read() == b'[]' else b',\n'
+        file.seek(-2, os.SEEK_END)
+        file.write(separator + body + b'\n]')
+        file.truncate()
+    os.replace(temp_path, path)
+
+def update_chat_clusters(chat_state, messages, cluster_stats):
+    gap = CLUSTER_TIME_GAP.total_seconds()
+    timestamps = sorted(
+        parse_timestamp(message["date"])
+        for message in messages if "date" in message and "text" in message
+    )
+    open_cluster = chat_state.get("open_cluster")
+    for timestamp in timestamps:
+        if open_cluster and timestamp - open_cluster["last"] <= gap:
+            open_cluster["length"] += 1
+            open_cluster["last"] = timestamp
+            continue
+        if open_cluster:
+            add_cluster_to_stats(
+                cluster_stats, open_cluster["length"], open_cluster["first"], open_cluster["last"],
+                chat_state.get("previous_cluster_end")
+            )
+            chat_state["previous_cluster_end"] = open_cluster["last"]
+        open_cluster = {"length": 1, "first": timestamp, "last": timestamp}
+    chat_state["open_cluster"] = open_cluster
+
+def filter_new_messages(messages, selected_user_ids, state, chat_state):
+    filtered_messages = []
+    message_ids = chat_state.setdefault("filtered_ids", {})
+    for message in messages:
+        if "date" in message and "text" in message and is_selected_message(message, selected_user_ids):
+            filtered_messages.append(renumber_message(dict(message), state["next_filtered_id"], message_ids))
+            state["next_filtered_id"] += 1
+    return filtered_messages
+
+def merge_new_messages(messages, user_ids, state, chat_state):
+    merged_records = []
+    message_ids = chat_state.setdefault("merged_ids", {})
+    for message in messages:
+        if message.get('text_entities') and message['from_id'] in user_ids:
+            merged_records.append(merge_message(message, state["next_message_id"], message_ids))
+            state["next_message_id"] += 1
+    return merged_records
+
+def read_new_raw_messages(json_files, state):
+    new_messages = []
+    for json_file in json_files:
+        digest = file_hash(json_file)
+        if state["files"].get(json_file) == digest:
+            continue
+        header = {}
+        stream = iter_messages(json_file, header)
+        first_message = next(stream, None)
+        chat_state = state["chats"].setdefault(chat_key(header, json_file), {"last_message_id": 0})
+        messages = [
+            message for message in chain([first_message] if first_message else [], stream)
+            if message.get('id', 0) > chat_state["last_message_id"]
+        ]
+        if messages:
+            chat_state["last_message_id"] = max(message['id'] for message in messages)
+        new_messages.append((chat_state, messages))
+        state["files"][json_file] = digest
+    return new_messages
+
+def write_cluster_data(state):
+    cluster_stats = copy.deepcopy(state["cluster_stats"])
+    for chat_state in state["chats"].values():
+        open_cluster = chat_state.get("open_cluster")
+        if open_cluster:
+            add_cluster_to_stats(
+                cluster_stats, open_cluster["length"], open_cluster["first"], open_cluster["last"],
+                chat_state.get("previous_cluster_end")
+            )
+    if sum(cluster_stats["length_counts"]):
+        process_cluster_stats(cluster_stats, OUTPUT_PROBABILITY_FILE)
+
+def run_incremental(data_folder=RAW_DATA_DIR, state_path=STATE_FILE, workers=1):
+    state = load_state(state_path)
+    if state is None:
+        state = new_state()
+        for path in (MERGED_FILE, TOKENIZED_FILE, LEMMATIZED_FILE):
+            write_json([], path)
+
+    user_ids = read_user_id(CONFIG_PATH)
+    json_files = sorted(
+        os.path.join(data_folder, file)
+        for file in os.listdir(data_folder)
+        if file.endswith('.json')
+    )
+
+    new_raw_messages = read_new_raw_messages(json_files, state)
+    if not any(messages for chat_state, messages in new_raw_messages):
+        save_state(state, state_path)
+        print("No new messages found.")
+        return 0
+
+    merged_records = []
+    filtered_messages = []
+    for chat_state, messages in new_raw_messages:
+        update_chat_clusters(chat_state, messages, state["cluster_stats"])
+        filtered_messages.extend(filter_new_messages(messages, user_ids, state, chat_state))
+        merged_records.extend(merge_new_messages(messages, user_ids, state, chat_state))
+
+    append_json_array(MERGED_FILE, merged_records)
+    tokenized_records = [
+        {**record, 'tokenized': tokenize_with_regex(record['text'])} for record in merged_records
+    ]
+    append_json_array(TOKENIZED_FILE, tokenized_records)
+    lemmatized = lemmatize_texts([record['text'] for record in merged_records], workers)
+    lemmatized_records = [
+        {**{key: value for key, value in record.items() if key != 'text'}, 'lemmatized': lemmas}
+        for record, lemmas in zip(merged_records, lemmatized)
+    ]
+    append_json_array(LEMMATIZED_FILE, lemmatized_records)
+
+    word_counts = count_words(lemmatized_records, Counter(state["word_counts"]))
+    state["word_counts"] = dict(word_counts)
+    if word_counts:
+        inverse_z_scores_from_counts(word_counts)
+
+    merged_graph = count_merged_replies(
+        merged_records, user_ids,
+        ReplyGraph.from_counts(state["merged_reply_counts"], state["merged_totals"], sorted(user_ids)),
+        state["merged_lookup"]
+    )
+    state["merged_reply_counts"], state["merged_totals"] = merged_graph.to_counts()
+    write_json(merged_graph.to_dict(MERGED_REPLY_RATE_DECIMALS), MERGED_REPLY_MATRIX_FILE)
+
+    reply_graph = count_replies(
+        {"clusters": [{"messages": filtered_messages}]},
+        ReplyGraph.from_counts(state["reply_counts"], state["reply_totals"]),
+        state["filtered_lookup"]
+    )
+    state["reply_counts"], state["reply_totals"] = reply_graph.to_counts()
+    write_json(reply_graph.to_dict(REPLY_RATE_DECIMALS), REPLY_MATRIX_FILE)
+
+    write_cluster_data(state)
+    if os.path.isdir(CORPUS_DIR):
+        convert_json(TOKENIZED_FILE, LEMMATIZED_FILE, CORPUS_DIR)
+
+    save_state(state, state_path)
+    print(f"Appended {len(merged_records)} new messages ({len(filtered_messages)} in the reply statistics).")
+    return len(merged_records)
+
+if __name__ == "__main__":
+    run_incremental()
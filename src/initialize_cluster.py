@@ -1,80 +1,74 @@
-import json
+import asyncio
 import random
 import time
+from functools import partial
+import metrics
+from cluster_sampler import get_cluster_sampler
 from generate_message import generate_message
-from build_ngrams import run_ngrams_with_similarity
 from similar_messages import process_similarity
 
-CLUSTER_DATA_FILE = "data/cluster_data.json"
-STARTER_PROB_FILE = "data/starter_message_probabilities.json"
-CLUSTER_REPLY_FILE = "data/cluster_reply_participation.json"
-
-def load_json(file_path):
-    with open(file_path, 'r', encoding='utf-8') as f:
-        return json.load(f)
-
-def initialize_cluster():
-    cluster_data = load_json(CLUSTER_DATA_FILE)["message_cluster_data"]
-    starter_data = load_json(STARTER_PROB_FILE)
-    
-    probabilities = [cluster['probability'] for cluster in cluster_data]
-    selected_cluster = random.choices(cluster_data, weights=probabilities, k=1)[0]
-    selected_cluster["length"] = random.randint(1, 50)
-    
-    user_probabilities = [user['probability'] for user in starter_data]
-    starter_user = random.choices(starter_data, weights=user_probabilities, k=1)[0]
-    
-    return {
-        "cluster": selected_cluster,
-        "starter_user": starter_user
-    }
+def initialize_cluster(sampler=None, rng=random):
+    sampler = sampler if sampler is not None else get_cluster_sampler()
+    return sampler.sample_cluster(rng)
+
+def choose_next_user(starter_user, sampler, rng=random):
+    return sampler.next_user(starter_user, rng)
 
-def choose_next_user(starter_user, participation_data):
-    participation_rates = participation_data[starter_user]["participation_rates"]
-    users = list(participation_rates.keys())
-    probabilities = [participation_rates[user]["rate"] for user in users]
-    
-    next_user = random.choices(users, weights=probabilities, k=1)[0]
-    return next_user
+def generate_reply_message(lemmatized_message, next_user, rng=random):
+    similar_message_ids = process_similarity(lemmatized_message, next_user)
+    return generate_message(next_user, mode="reply", similar_message_ids=similar_message_ids, rng=rng)
 
-def simulate_replies_one_by_one(cluster_info, participation_data):
+def simulate_replies_one_by_one(cluster_info, sampler, buffer=None, rng=random, sleep=time.sleep):
     starter_user = cluster_info['starter_user']
     print(f"Starter User: {starter_user}")
-    starter_message, lemmatized_message = generate_message(starter_user["user_id"], mode="starter")
-    
+    if buffer is not None:
+        starter_message, lemmatized_message = buffer.starter(starter_user["user_id"]).result()
+    else:
+        starter_message, lemmatized_message = generate_message(starter_user["user_id"], mode="starter", rng=rng)
+
+    cluster = cluster_info['cluster']
+    cluster_length = cluster["length"]
+    avg_message_delay = cluster["avg_message_delay"]
+
+    current_user = choose_next_user(starter_user['user_id'], sampler, rng)
+    next_user = choose_next_user(current_user, sampler, rng) if cluster_length > 1 else None
+    if buffer is not None and next_user is not None:
+        buffer.speculate(lemmatized_message, next_user)
+
     yield {
         "from": starter_user['user_id'],
         "message": starter_message
     }
-    
-    cluster = cluster_info['cluster']
-    cluster_length = cluster["length"]
-    avg_message_delay = cluster["avg_message_delay"]
-    
-    current_user = choose_next_user(starter_user['user_id'], participation_data)
-    
+
     for i in range(cluster_length - 1):
-        next_user = choose_next_user(current_user, participation_data)
         print(f"Next User: {next_user}")
-        run_ngrams_with_similarity(lemmatized_message, next_user)
-        
-        reply_message, lemmatized_message = generate_message(next_user, mode="reply")
+        metrics.observe("message_sleep", avg_message_delay / 50)
+        if buffer is not None:
+            sleep(avg_message_delay / 50)
+            reply_message, lemmatized_message = buffer.reply(lemmatized_message, next_user).result()
+        else:
+            reply_message, lemmatized_message = generate_reply_message(lemmatized_message, next_user, rng)
+            sleep(avg_message_delay / 50)
+
+        reply_user = next_user
+        if i < cluster_length - 2:
+            next_user = choose_next_user(current_user, sampler, rng)
+            if buffer is not None:
+                buffer.speculate(lemmatized_message, next_user)
 
-        time.sleep(avg_message_delay / 50)
-        
         yield {
-            "from": next_user,
+            "from": reply_user,
             "message": reply_message
         }
 
-def simulate_cluster_conversation():
+def simulate_cluster_conversation(buffer=None):
     while True:
-        cluster_info = initialize_cluster()
-        participation_data = load_json(CLUSTER_REPLY_FILE)
+        sampler = get_cluster_sampler()
+        cluster_info = initialize_cluster(sampler)
         cluster_delay = cluster_info['cluster']['avg_cluster_delay']
         print(cluster_info)
         
-        reply_generator = simulate_replies_one_by_one(cluster_info, participation_data)
+        reply_generator = simulate_replies_one_by_one(cluster_info, sampler, buffer)
 
         for reply in reply_generator:
             yield reply
@@ -82,8 +76,75 @@ def simulate_cluster_conversation():
         for reply in reply_generator:
             print(f"User {reply['from']} says: {reply['message']}")
         '''
+        metrics.observe("cluster_sleep", cluster_delay / 100)
         time.sleep(cluster_delay / 100)
 
+def load_cluster_state():
+    sampler = get_cluster_sampler()
+    return sampler.sample_cluster(), sampler
+
+async def simulate_replies_async(cluster_info, sampler, executor=None, buffer=None):
+    loop = asyncio.get_running_loop()
+    starter_user = cluster_info['starter_user']
+    print(f"Starter User: {starter_user}")
+    if buffer is not None:
+        with metrics.timer("message_wait"):
+            starter_message, lemmatized_message = await asyncio.wrap_future(buffer.starter(starter_user["user_id"]))
+    else:
+        starter_message, lemmatized_message = await loop.run_in_executor(
+            executor, partial(generate_message, starter_user["user_id"], mode="starter")
+        )
+
+    cluster = cluster_info['cluster']
+    cluster_length = cluster["length"]
+    avg_message_delay = cluster["avg_message_delay"]
+
+    current_user = choose_next_user(starter_user['user_id'], sampler)
+    next_user = choose_next_user(current_user, sampler) if cluster_length > 1 else None
+    if buffer is not None and next_user is not None:
+        buffer.speculate(lemmatized_message, next_user)
+
+    yield {
+        "from": starter_user['user_id'],
+        "message": starter_message
+    }
+
+    for i in range(cluster_length - 1):
+        print(f"Next User: {next_user}")
+        metrics.observe("message_sleep", avg_message_delay / 50)
+        if buffer is not None:
+            await asyncio.sleep(avg_message_delay / 50)
+            with metrics.timer("message_wait"):
+                reply_message, lemmatized_message = await asyncio.wrap_future(buffer.reply(lemmatized_message, next_user))
+        else:
+            reply_message, lemmatized_message = await loop.run_in_executor(
+                executor, generate_reply_message, lemmatized_message, next_user
+            )
+            await asyncio.sleep(avg_message_delay / 50)
+
+        reply_user = next_user
+        if i < cluster_length - 2:
+            next_user = choose_next_user(current_user, sampler)
+            if buffer is not None:
+                buffer.speculate(lemmatized_message, next_user)
+
+        yield {
+            "from": reply_user,
+            "message": reply_message
+        }
+
+async def simulate_cluster_conversation_async(executor=None, buffer=None):
+    loop = asyncio.get_running_loop()
+    while True:
+        cluster_info, sampler = await loop.run_in_executor(executor, load_cluster_state)
+        cluster_delay = cluster_info['cluster']['avg_cluster_delay']
+        print(cluster_info)
+
+        async for reply in simulate_replies_async(cluster_info, sampler, executor, buffer):
+            yield reply
+        metrics.observe("cluster_sleep", cluster_delay / 100)
+        await asyncio.sleep(cluster_delay / 100)
+
 '''
 def main():
     simulate_cluster_conversation()
@@ -1,35 +1,54 @@
+import argparse
 import json
-import nltk
-import pymorphy3
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
+from concurrent.futures import ProcessPoolExecutor
+from lemmatizer import get_lemmatizer
 
-nltk.download('punkt')
-nltk.download('stopwords')
-morph = pymorphy3.MorphAnalyzer()
-stop_words = set(stopwords.words('russian'))
-stop_words.add('это')
+LEMMATIZE_CHUNK_SIZE = 2000
 
 def lemmatize_text(text):
-    tokens = word_tokenize(text.lower())
-    filtered_tokens = [token for token in tokens if token.isalpha() and token not in stop_words]
-    lemmatized_tokens = [morph.parse(token)[0].normal_form for token in filtered_tokens]
-    return lemmatized_tokens
+    return get_lemmatizer().lemmatize_text(text)
 
-def process_json(input_path, output_path):
+def lemmatize_chunk(texts):
+    lemmatizer = get_lemmatizer()
+    before = lemmatizer.cache_stats()
+    lemmatized = [lemmatizer.lemmatize_text(text) for text in texts]
+    after = lemmatizer.cache_stats()
+    return lemmatized, after['hits'] - before['hits'], after['misses'] - before['misses']
+
+def lemmatize_texts(texts, workers=1, chunk_size=LEMMATIZE_CHUNK_SIZE):
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(lemmatize_chunk, chunks))
+    else:
+        results = [lemmatize_chunk(chunk) for chunk in chunks]
+
+    hits = sum(result[1] for result in results)
+    misses = sum(result[2] for result in results)
+    lookups = hits + misses
+    print(f"Lemma cache: {hits} hits, {misses} misses, hit rate {hits / lookups if lookups else 0.0:.2%}.")
+    return [lemmas for result in results for lemmas in result[0]]
+
+def process_json(input_path, output_path, workers=1, chunk_size=LEMMATIZE_CHUNK_SIZE):
     with open(input_path, 'r', encoding='utf-8') as file:
         data = json.load(file)
-        
-    for message in data:
-        message['lemmatized'] = lemmatize_text(message['text'])
+
+    lemmatized = lemmatize_texts([message['text'] for message in data], workers, chunk_size)
+    for message, lemmas in zip(data, lemmatized):
+        message['lemmatized'] = lemmas
         del message['text']
 
     with open(output_path, 'w', encoding='utf-8') as file:
         json.dump(data, file, ensure_ascii=False, indent=1)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lemmatize the merged corpus.")
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--chunk-size', type=int, default=LEMMATIZE_CHUNK_SIZE)
+    args = parser.parse_args()
+
     input_path = 'data/merged/merged.json'
     output_path = 'data/lemmatized_output.json'
-    
-    process_json(input_path, output_path)
+
+    process_json(input_path, output_path, args.workers, args.chunk_size)
     print(f"Lemmatized data has been saved to {output_path}.")
@@ -0,0 +1,88 @@
+import argparse
+import os
+import threading
+from functools import lru_cache
+
+LEMMA_CACHE_SIZE = 200000
+NLTK_DATA_DIR = 'data/nltk_data'
+NLTK_RESOURCES = {
+    'punkt_tab': 'tokenizers/punkt_tab/english/',
+    'stopwords': 'corpora/stopwords/russian'
+}
+
+_default_lemmatizer = None
+_default_lock = threading.Lock()
+
+def ensure_nltk_resources(data_dir=NLTK_DATA_DIR):
+    import nltk
+
+    if os.path.isdir(data_dir) and os.path.abspath(data_dir) not in nltk.data.path:
+        nltk.data.path.insert(0, os.path.abspath(data_dir))
+    missing = []
+    for resource, path in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            missing.append(resource)
+    if missing:
+        raise LookupError(
+            f"Missing NLTK resources {', '.join(missing)}. "
+            f"Run `python lemmatizer.py` once with network access to download them into {data_dir}."
+        )
+
+def download_nltk_resources(data_dir=NLTK_DATA_DIR):
+    import nltk
+
+    os.makedirs(data_dir, exist_ok=True)
+    for resource in NLTK_RESOURCES:
+        if not nltk.download(resource, download_dir=data_dir, raise_on_error=True):
+            raise RuntimeError(f"Failed to download NLTK resource {resource}.")
+
+class Lemmatizer:
+    def __init__(self, cache_size=LEMMA_CACHE_SIZE, nltk_data_dir=NLTK_DATA_DIR):
+        import pymorphy3
+        from nltk.corpus import stopwords
+        from nltk.tokenize import word_tokenize
+
+        ensure_nltk_resources(nltk_data_dir)
+        self.word_tokenize = word_tokenize
+        self.morph = pymorphy3.MorphAnalyzer()
+        self.stop_words = set(stopwords.words('russian'))
+        self.stop_words.add('это')
+        self.lemmatize_token = lru_cache(maxsize=cache_size)(self._parse_token)
+
+    def _parse_token(self, token):
+        return self.morph.parse(token)[0].normal_form
+
+    def lemmatize_text(self, text):
+        tokens = self.word_tokenize(text.lower())
+        return [
+            self.lemmatize_token(token)
+            for token in tokens if token.isalpha() and token not in self.stop_words
+        ]
+
+    def cache_stats(self):
+        info = self.lemmatize_token.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            "hits": info.hits,
+            "misses": info.misses,
+            "size": info.currsize,
+            "hit_rate": info.hits / lookups if lookups else 0.0
+        }
+
+def get_lemmatizer():
+    global _default_lemmatizer
+    with _default_lock:
+        if _default_lemmatizer is None:
+            _default_lemmatizer = Lemmatizer()
+    return _default_lemmatizer
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download the NLTK resources the lemmatizer needs for offline use.")
+    parser.add_argument('--data-dir', default=NLTK_DATA_DIR)
+    args = parser.parse_args()
+
+    download_nltk_resources(args.data_dir)
+    ensure_nltk_resources(args.data_dir)
+    print(f"NLTK resources saved to {args.data_dir}.")
@@ -1,57 +1,61 @@
 import os
 import json
-from collections import defaultdict
+from reply_graph import ReplyGraph
+from telegram_stream import chat_key, iter_messages
+
+REPLY_RATE_DECIMALS = 2
 
 def read_json(path):
     with open(path, 'r', encoding='utf-8') as file:
         return json.load(file)
 
 def write_json(data, path):
-    with open(path, 'w', encoding='utf-8') as file:
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as file:
         json.dump(data, file, ensure_ascii=False, indent=1)
+    os.replace(temp_path, path)
 
 def read_user_id(path):
     config = read_json(path) 
     return {entry['user_id'] for entry in config}
 
+def merge_message(message, message_id, message_ids):
+    message_ids[message['id']] = message_id
+    return {
+        'message_id': message_id,
+        'user_id': message['from_id'],
+        'text': ' '.join(entity.get('text', '') for entity in message['text_entities']),
+        'reply_to': message_ids.get(message.get('reply_to_message_id'))
+    }
+
+def iter_merged_messages(json_files, user_id):
+    message_id = 0
+    chat_message_ids = {}
+    for json_file in json_files:
+        header = {}
+        for message in iter_messages(json_file, header):
+            if message.get('text_entities') and message['from_id'] in user_id:
+                message_id += 1
+                yield merge_message(message, message_id, chat_message_ids.setdefault(chat_key(header, json_file), {}))
+
 def extract_and_merge(json_files, user_id):
-    return [
-        {
-            'message_id': idx + 1,
-            'user_id': message['from_id'],
-            'text': ' '.join(entity.get('text', '') for entity in message['text_entities']),
-            'reply_to': message.get('reply_to_message_id')
-        }
-        for idx, message in enumerate(
-            message
-            for json_file in json_files
-            for message in read_json(json_file).get('messages', [])
-            if message.get('text_entities') and message['from_id'] in user_id
-        )
-    ]
+    return list(iter_merged_messages(json_files, user_id))
 
-def calculate_reply_matrix(data, user_ids):
-    reply_count = {user: defaultdict(int) for user in user_ids}
-    total_messages = defaultdict(int)
-    message_lookup = {msg['message_id']: msg['user_id'] for msg in data}
+def count_replies(data, user_ids, graph=None, message_lookup=None):
+    graph = graph if graph is not None else ReplyGraph(sorted(user_ids))
+    message_lookup = message_lookup if message_lookup is not None else {}
+    message_lookup.update((msg['message_id'], msg['user_id']) for msg in data)
 
     for message in data:
-        user_id = message['user_id']
-        total_messages[user_id] += 1
-        if 'reply_to' in message and message['reply_to'] in message_lookup:
+        graph.add_message(message['user_id'])
+        if message.get('reply_to') in message_lookup:
             replied_user = message_lookup[message['reply_to']]
             if replied_user in user_ids:
-                reply_count[user_id][replied_user] += 1
+                graph.add_reply(message['user_id'], replied_user)
+    return graph
 
-    reply_matrix = {
-        user: {
-            replied_user: round(reply_count[user][replied_user] / total_messages[user], 2) if total_messages[user] > 0 else 0.0
-            for replied_user in user_ids
-        }
-        for user in user_ids
-    }
-    
-    return reply_matrix
+def calculate_reply_matrix(data, user_ids):
+    return count_replies(data, user_ids).to_dict(REPLY_RATE_DECIMALS)
 
 def process_data():
     data_folder = 'data/raw'
@@ -0,0 +1,80 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from generate_message import generate_message
+from initialize_cluster import generate_reply_message
+
+STARTER_BUFFER_DEPTH = 3
+MAX_PENDING_REPLIES = 64
+PRODUCER_WORKERS = 2
+
+class MessageBuffer:
+    def __init__(self, executor=None, depth=STARTER_BUFFER_DEPTH, max_pending_replies=MAX_PENDING_REPLIES):
+        self.executor = executor if executor is not None else ThreadPoolExecutor(max_workers=PRODUCER_WORKERS)
+        self.depth = depth
+        self.max_pending_replies = max_pending_replies
+        self.starters = {}
+        self.replies = {}
+        self.lock = threading.Lock()
+        self.ready = 0
+        self.waited = 0
+
+    def prefill(self, users):
+        with self.lock:
+            for user in users:
+                self._refill(user)
+
+    def _refill(self, user):
+        queue = self.starters.setdefault(user, deque())
+        while len(queue) < self.depth:
+            queue.append(self.executor.submit(generate_message, user, mode="starter"))
+        return queue
+
+    def _count(self, future):
+        if future.done():
+            self.ready += 1
+        else:
+            self.waited += 1
+        return future
+
+    def starter(self, user):
+        with self.lock:
+            future = self._refill(user).popleft()
+            self._refill(user)
+            return self._count(future)
+
+    def speculate(self, lemmatized_message, user):
+        key = (tuple(lemmatized_message), user)
+        with self.lock:
+            if key in self.replies:
+                return
+            self.replies[key] = self.executor.submit(generate_reply_message, lemmatized_message, user)
+            while len(self.replies) > self.max_pending_replies:
+                self.replies.pop(next(iter(self.replies))).cancel()
+
+    def reply(self, lemmatized_message, user):
+        key = (tuple(lemmatized_message), user)
+        with self.lock:
+            future = self.replies.pop(key, None)
+            if future is None:
+                future = self.executor.submit(generate_reply_message, lemmatized_message, user)
+            return self._count(future)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "ready": self.ready,
+                "waited": self.waited,
+                "buffered_starters": sum(len(queue) for queue in self.starters.values()),
+                "pending_replies": len(self.replies)
+            }
+
+    def close(self):
+        with self.lock:
+            for future in self.replies.values():
+                future.cancel()
+            for queue in self.starters.values():
+                for future in queue:
+                    future.cancel()
+            self.replies.clear()
+            self.starters.clear()
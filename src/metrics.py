@@ -0,0 +1,168 @@
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+
+HISTOGRAM_BOUNDS = [1e-5 * 2 ** i for i in range(24)]
+SNAPSHOT_INTERVAL_SECONDS = 30
+PROFILE_INTERVAL_SECONDS = 0.005
+
+class Histogram:
+    def __init__(self, bounds=HISTOGRAM_BOUNDS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(self.bounds[index], self.max) if index < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "mean": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            "buckets": {
+                (f"{bound:.6g}" if index < len(self.bounds) else "inf"): count
+                for index, (bound, count) in enumerate(zip(self.bounds + [None], self.counts)) if count
+            }
+        }
+
+class Timer:
+    __slots__ = ("registry", "name", "started")
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.registry.observe(self.name, time.perf_counter() - self.started)
+        return False
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = Counter()
+        self.histograms = {}
+        self.started_at = time.time()
+
+    def increment(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def observe(self, name, value):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(value)
+
+    def timer(self, name):
+        return Timer(self, name)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "timestamp": time.time(),
+                "uptime_seconds": time.time() - self.started_at,
+                "counters": dict(self.counters),
+                "histograms": {name: histogram.snapshot() for name, histogram in self.histograms.items()}
+            }
+
+    def write_snapshot(self, path):
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=1)
+        os.replace(temp_path, path)
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.started_at = time.time()
+
+class SamplingProfiler:
+    def __init__(self, output_path, interval=PROFILE_INTERVAL_SECONDS):
+        self.output_path = output_path
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.running = threading.Event()
+        self.thread = None
+
+    def sample(self):
+        own_thread = threading.get_ident()
+        while self.running.is_set():
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+            time.sleep(self.interval)
+
+    def start(self):
+        if self.running.is_set():
+            return
+        self.running.set()
+        self.thread = threading.Thread(target=self.sample, name="sampling-profiler", daemon=True)
+        self.thread.start()
+        print("[DEBUG] Sampling profiler started.")
+
+    def stop(self):
+        if not self.running.is_set():
+            return
+        self.running.clear()
+        self.thread.join()
+        with open(self.output_path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        print(f"[DEBUG] Sampling profiler stopped after {self.samples} samples, stacks saved to {self.output_path}.")
+
+    def toggle(self):
+        if self.running.is_set():
+            self.stop()
+        else:
+            self.start()
+
+metrics = Metrics()
+
+def increment(name, amount=1):
+    metrics.increment(name, amount)
+
+def observe(name, value):
+    metrics.observe(name, value)
+
+def timer(name):
+    return metrics.timer(name)
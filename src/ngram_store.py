@@ -0,0 +1,128 @@
+import threading
+from collections import defaultdict
+import numpy as np
+import metrics
+from build_ngrams import build_ngrams
+from corpus_format import CORPUS_DIR, Corpus, corpus_files, corpus_is_fresh, file_mtimes, load_messages
+from transition_model import (
+    TRANSITION_TABLES_DIR, ArrayTransitionModel, TransitionModel, TransitionTables, transition_table_files,
+    transition_tables_fresh, write_transition_tables
+)
+
+TOKENIZED_DATA_FILE = 'data/tokenized_output.json'
+SOURCE_FILES = (TOKENIZED_DATA_FILE, *corpus_files(), *transition_table_files())
+
+_default_store = None
+_default_mtimes = None
+_default_lock = threading.Lock()
+
+class NgramStore:
+    def __init__(self, input_path=TOKENIZED_DATA_FILE, corpus_dir=CORPUS_DIR, tables_dir=TRANSITION_TABLES_DIR):
+        self.input_path = input_path
+        self.corpus_dir = corpus_dir
+        self.tables_dir = tables_dir
+        self.corpus = None
+        self.tables = None
+        self.user_rows = {}
+        self.user_ngrams = {}
+        self.models = {}
+        self.load()
+
+    def load(self):
+        self.models = {}
+        if self.tables_dir and transition_tables_fresh([self.input_path, *corpus_files(self.corpus_dir)], self.tables_dir):
+            self.tables = TransitionTables(self.tables_dir)
+        if corpus_is_fresh(self.input_path, self.corpus_dir):
+            self.load_corpus()
+            return
+        user_ngrams = defaultdict(dict)
+        with metrics.timer("ngram_store_load"):
+            for message in load_messages(self.input_path):
+                tokens = message['tokenized']
+                user_ngrams[message['user_id']][message['message_id']] = {
+                    'bigrams': build_ngrams(tokens, 2),
+                    'trigrams': build_ngrams(tokens, 3)
+                }
+        self.user_ngrams = dict(user_ngrams)
+
+    def load_corpus(self):
+        with metrics.timer("ngram_store_load"):
+            self.corpus = Corpus(self.corpus_dir)
+            user_ids = np.asarray(self.corpus.columns['user_ids'])
+            rows = np.argsort(user_ids, kind='stable')
+            bounds = np.searchsorted(user_ids[rows], np.arange(len(self.corpus.users) + 1)).tolist()
+            message_ids = np.asarray(self.corpus.columns['message_ids'])
+            self.user_rows = {}
+            for user_index, user_id in enumerate(self.corpus.users):
+                user_rows = rows[bounds[user_index]:bounds[user_index + 1]]
+                order = np.argsort(message_ids[user_rows], kind='stable')
+                self.user_rows[user_id] = (user_rows, message_ids[user_rows][order], user_rows[order])
+
+    def corpus_rows(self, user_id, message_ids=None):
+        if user_id not in self.user_rows:
+            return []
+        rows, sorted_ids, sorted_rows = self.user_rows[user_id]
+        if message_ids is None:
+            return rows.tolist()
+        message_ids = list(message_ids)
+        positions = np.searchsorted(sorted_ids, message_ids, side='right') - 1
+        return [
+            int(sorted_rows[position])
+            for message_id, position in zip(message_ids, positions.tolist())
+            if position >= 0 and sorted_ids[position] == message_id
+        ]
+
+    def get_ngrams(self, user_id, ngram_type, message_ids=None):
+        if self.corpus is not None:
+            n = 2 if ngram_type == 'bigrams' else 3
+            return [
+                ngram
+                for row in self.corpus_rows(user_id, message_ids)
+                for ngram in build_ngrams(self.corpus.tokens(row), n)
+            ]
+        messages = self.user_ngrams.get(user_id, {})
+        if message_ids is None:
+            return [ngram for entry in messages.values() for ngram in entry[ngram_type]]
+        return [
+            ngram
+            for message_id in message_ids if message_id in messages
+            for ngram in messages[message_id][ngram_type]
+        ]
+
+    def get_model(self, user_id):
+        model = self.models.get(user_id)
+        if model is None:
+            with metrics.timer("model_load"):
+                if self.tables is not None and user_id in self.tables:
+                    model = self.models[user_id] = ArrayTransitionModel(self.tables, user_id)
+                else:
+                    model = self.models[user_id] = TransitionModel(self.get_user_ngrams(user_id))
+        return model
+
+    def get_user_ngrams(self, user_id):
+        return self.get_ngrams(user_id, 'bigrams') + self.get_ngrams(user_id, 'trigrams')
+
+    def users(self):
+        return list(self.user_rows) if self.corpus is not None else list(self.user_ngrams)
+
+def build_transition_tables(input_path=TOKENIZED_DATA_FILE, corpus_dir=CORPUS_DIR, output_dir=TRANSITION_TABLES_DIR):
+    store = NgramStore(input_path, corpus_dir, tables_dir=None)
+    return write_transition_tables(
+        ((user_id, TransitionModel(store.get_user_ngrams(user_id))) for user_id in store.users()),
+        output_dir
+    )
+
+def get_ngram_store():
+    global _default_store, _default_mtimes
+    with _default_lock:
+        mtimes = file_mtimes(SOURCE_FILES)
+        if _default_store is None or mtimes != _default_mtimes:
+            try:
+                _default_store = NgramStore()
+            except (OSError, ValueError, KeyError) as e:
+                if _default_store is None:
+                    raise
+                print(f"[WARNING] Keeping the previous n-gram store, reload failed: {e}")
+                return _default_store
+            _default_mtimes = mtimes
+    return _default_store
@@ -0,0 +1,206 @@
+import argparse
+import hashlib
+import os
+import resource
+import time
+import tracemalloc
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from calculate_replies import REPLY_RATE_DECIMALS, filter_and_count_replies
+from cluster_messages import (
+    compute_cluster_stats, iter_cluster_records, iter_file_clusters, process_cluster_stats
+)
+from compute_score import compute_inverse_z_scores
+from corpus_format import CORPUS_DIR, write_corpus
+from incremental import file_hash
+from lemmatize_data import lemmatize_texts
+from merge_raw_data import calculate_reply_matrix, extract_and_merge, read_json, read_user_id, write_json
+from tokenize_data import tokenize_texts
+
+RAW_DATA_DIR = 'data/raw'
+CONFIG_PATH = 'data/configs/config.json'
+STATE_FILE = 'data/pipeline_state.json'
+REPORT_FILE = 'data/pipeline_report.json'
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+STAGE_OUTPUTS = {
+    'merge': ['data/merged/reply_matrix.json'],
+    'tokenize': ['data/tokenized_output.json'],
+    'lemmatize': ['data/lemmatized_output.json'],
+    'z_score': ['data/word_stats.npz'],
+    'cluster': ['data/cluster_data.json'],
+    'replies': ['data/reply_matrix.json']
+}
+STAGE_DEPENDENCIES = {
+    'merge': [],
+    'tokenize': ['merge'],
+    'lemmatize': ['merge'],
+    'z_score': ['lemmatize'],
+    'cluster': [],
+    'replies': ['cluster']
+}
+STAGE_SOURCES = {
+    'merge': ['merge_raw_data.py', 'reply_graph.py', 'telegram_stream.py'],
+    'tokenize': ['tokenize_data.py'],
+    'lemmatize': ['lemmatize_data.py', 'lemmatizer.py'],
+    'z_score': ['compute_score.py', 'word_stats.py'],
+    'cluster': ['cluster_messages.py', 'telegram_stream.py'],
+    'replies': ['calculate_replies.py', 'filter_selected_users.py', 'reply_graph.py', 'telegram_stream.py']
+}
+
+def fingerprint(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+    return digest.hexdigest()
+
+def stage_fingerprints(raw_files, config_path):
+    inputs = fingerprint(*(f"{path}:{file_hash(path)}" for path in raw_files), file_hash(config_path))
+    fingerprints = {}
+    for stage in STAGE_DEPENDENCIES:
+        sources = [file_hash(os.path.join(SOURCE_DIR, source)) for source in STAGE_SOURCES[stage]]
+        upstream = [fingerprints[dependency] for dependency in STAGE_DEPENDENCIES[stage]]
+        fingerprints[stage] = fingerprint(inputs, *sources, *upstream)
+    return fingerprints
+
+def stages_to_run(fingerprints, previous, force=False):
+    changed = {
+        stage for stage in STAGE_DEPENDENCIES
+        if force or previous.get(stage) != fingerprints[stage]
+        or not all(os.path.exists(path) for path in STAGE_OUTPUTS[stage])
+    }
+    pending = list(changed)
+    while pending:
+        for dependency in STAGE_DEPENDENCIES[pending.pop()]:
+            if dependency not in changed:
+                changed.add(dependency)
+                pending.append(dependency)
+    return changed
+
+class StageTimer:
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.report = {}
+        if trace_memory:
+            tracemalloc.start()
+
+    def start(self, stage):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        return time.perf_counter()
+
+    def stop(self, stage, started):
+        self.record(stage, time.perf_counter() - started, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+    def record(self, stage, seconds, max_rss_kb, in_worker=False):
+        entry = {
+            "seconds": round(seconds, 4),
+            "skipped": False,
+            "max_rss_mb": round(max_rss_kb / 1024, 1)
+        }
+        if in_worker:
+            entry["in_worker"] = True
+        elif self.trace_memory:
+            entry["peak_traced_mb"] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+        self.report[stage] = entry
+        print(f"[{stage}] {entry['seconds']:.2f}s, max RSS {entry['max_rss_mb']} MB")
+
+def run_timed(function, texts):
+    started = time.perf_counter()
+    result = function(texts)
+    return result, time.perf_counter() - started, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def run_pipeline(data_folder=RAW_DATA_DIR, workers=2, force=False, write_binary_corpus=False, trace_memory=False):
+    raw_files = sorted(
+        os.path.join(data_folder, file)
+        for file in os.listdir(data_folder)
+        if file.endswith('.json')
+    )
+    fingerprints = stage_fingerprints(raw_files, CONFIG_PATH)
+    previous = read_json(STATE_FILE) if os.path.exists(STATE_FILE) else {}
+    run = stages_to_run(fingerprints, previous, force)
+    write_binary_corpus = write_binary_corpus or os.path.isdir(CORPUS_DIR)
+    if write_binary_corpus and run & {'tokenize', 'lemmatize'}:
+        run |= {'tokenize', 'lemmatize'}
+    timer = StageTimer(trace_memory)
+    total_started = time.perf_counter()
+    user_ids = read_user_id(CONFIG_PATH)
+
+    merged_data = None
+    if 'merge' in run:
+        started = timer.start('merge')
+        merged_data = extract_and_merge(raw_files, user_ids)
+        write_json(calculate_reply_matrix(merged_data, user_ids), STAGE_OUTPUTS['merge'][0])
+        timer.stop('merge', started)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        texts = [message['text'] for message in merged_data] if merged_data is not None else []
+        futures = {
+            stage: pool.submit(run_timed, function, texts)
+            for stage, function in (('tokenize', tokenize_texts), ('lemmatize', lemmatize_texts))
+            if stage in run
+        }
+
+        if 'cluster' in run:
+            fused_stage = 'cluster+replies' if 'replies' in run else 'cluster'
+            started = timer.start(fused_stage)
+            timestamps, file_starts = array('q'), []
+            clusters = iter_file_clusters(raw_files, timestamps, file_starts)
+            if 'replies' in run:
+                reply_graph = filter_and_count_replies(iter_cluster_records(clusters), user_ids)
+                write_json(reply_graph.to_dict(REPLY_RATE_DECIMALS), STAGE_OUTPUTS['replies'][0])
+            else:
+                for _ in clusters:
+                    pass
+            process_cluster_stats(compute_cluster_stats(timestamps, file_starts), STAGE_OUTPUTS['cluster'][0])
+            timer.stop(fused_stage, started)
+
+        results = {}
+        for stage, future in futures.items():
+            results[stage], seconds, max_rss_kb = future.result()
+            timer.record(stage, seconds, max_rss_kb, in_worker=True)
+
+    if 'tokenize' in results:
+        tokenized_data = [
+            {**message, 'tokenized': tokens} for message, tokens in zip(merged_data, results['tokenize'])
+        ]
+        write_json(tokenized_data, STAGE_OUTPUTS['tokenize'][0])
+    if 'lemmatize' in results:
+        lemmatized_data = [
+            {**{key: value for key, value in message.items() if key != 'text'}, 'lemmatized': lemmas}
+            for message, lemmas in zip(merged_data, results['lemmatize'])
+        ]
+        write_json(lemmatized_data, STAGE_OUTPUTS['lemmatize'][0])
+        if 'z_score' in run:
+            started = timer.start('z_score')
+            compute_inverse_z_scores(lemmatized_data, STAGE_OUTPUTS['z_score'][0])
+            timer.stop('z_score', started)
+    if write_binary_corpus and results:
+        started = timer.start('corpus')
+        write_corpus(
+            ({**message, 'tokenized': tokens, 'lemmatized': lemmas}
+             for message, tokens, lemmas in zip(merged_data, results['tokenize'], results['lemmatize'])),
+            CORPUS_DIR
+        )
+        timer.stop('corpus', started)
+
+    for stage in STAGE_DEPENDENCIES:
+        if stage not in run:
+            timer.report[stage] = {"seconds": 0.0, "skipped": True}
+            print(f"[{stage}] skipped, inputs unchanged")
+
+    timer.report["total"] = {"seconds": round(time.perf_counter() - total_started, 4)}
+    write_json(fingerprints, STATE_FILE)
+    write_json(timer.report, REPORT_FILE)
+    return timer.report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the whole offline build in one process.")
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--force', action='store_true', help="rerun every stage even if inputs are unchanged")
+    parser.add_argument('--corpus', action='store_true', help="also write the binary corpus to data/corpus")
+    parser.add_argument('--trace-memory', action='store_true', help="report tracemalloc peaks per stage")
+    args = parser.parse_args()
+
+    run_pipeline(workers=args.workers, force=args.force, write_binary_corpus=args.corpus, trace_memory=args.trace_memory)
+    print(f"Pipeline report saved to {REPORT_FILE}.")
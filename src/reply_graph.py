@@ -0,0 +1,90 @@
+from array import array
+import numpy as np
+from scipy import sparse
+
+class ReplyGraph:
+    def __init__(self, users=()):
+        self.users = []
+        self.index = {}
+        self.message_counts = array('q')
+        self.senders = array('l')
+        self.targets = array('l')
+        self.weights = array('d')
+        self._matrix = None
+        for user in users:
+            self.add_user(user)
+
+    @classmethod
+    def from_counts(cls, reply_counts, total_messages, users=()):
+        graph = cls(users)
+        for user, total in total_messages.items():
+            graph.message_counts[graph.add_user(user)] += total
+        for user, replies in reply_counts.items():
+            for replied_user, count in replies.items():
+                graph.add_reply(user, replied_user, count)
+        return graph
+
+    @classmethod
+    def from_participation(cls, participation_data):
+        graph = cls(participation_data)
+        for user, entry in participation_data.items():
+            for replied_user, rate in entry["participation_rates"].items():
+                graph.add_reply(user, replied_user, rate["rate"])
+        return graph
+
+    def add_user(self, user):
+        user_index = self.index.get(user)
+        if user_index is None:
+            user_index = self.index[user] = len(self.users)
+            self.users.append(user)
+            self.message_counts.append(0)
+            self._matrix = None
+        return user_index
+
+    def add_message(self, user):
+        self.message_counts[self.add_user(user)] += 1
+
+    def add_reply(self, user, replied_user, weight=1):
+        self.senders.append(self.add_user(user))
+        self.targets.append(self.add_user(replied_user))
+        self.weights.append(weight)
+        self._matrix = None
+
+    def matrix(self):
+        if self._matrix is None:
+            size = len(self.users)
+            self._matrix = sparse.csr_matrix(
+                (np.asarray(self.weights), (np.asarray(self.senders), np.asarray(self.targets))),
+                shape=(size, size)
+            )
+            self._matrix.sum_duplicates()
+        return self._matrix
+
+    def rates(self):
+        matrix = self.matrix()
+        totals = np.asarray(self.message_counts, dtype=np.float64)
+        row_totals = np.repeat(totals, np.diff(matrix.indptr))
+        data = np.divide(matrix.data, row_totals, out=np.zeros_like(matrix.data), where=row_totals > 0)
+        return sparse.csr_matrix((data, matrix.indices, matrix.indptr), shape=matrix.shape)
+
+    def to_dict(self, decimals):
+        rates = self.rates()
+        indptr, indices, data = rates.indptr.tolist(), rates.indices.tolist(), rates.data.tolist()
+        return {
+            user: {
+                self.users[indices[k]]: round(data[k], decimals)
+                for k in range(indptr[row], indptr[row + 1])
+            }
+            for row, user in enumerate(self.users)
+        }
+
+    def to_counts(self):
+        matrix = self.matrix()
+        indptr, indices, data = matrix.indptr.tolist(), matrix.indices.tolist(), matrix.data.tolist()
+        reply_counts = {
+            user: {self.users[indices[k]]: int(data[k]) for k in range(indptr[row], indptr[row + 1])}
+            for row, user in enumerate(self.users)
+            if indptr[row] < indptr[row + 1]
+        }
+        total_messages = {user: count for user, count in zip(self.users, self.message_counts) if count}
+        return reply_counts, total_messages
@@ -0,0 +1,200 @@
+import asyncio
+from collections import deque
+import metrics
+
+BOT_MESSAGES_PER_SECOND = 30
+CHAT_MESSAGES_PER_MINUTE = 20
+MAX_CONCURRENT_SENDS = 16
+MAX_RETRIES = 3
+BACKOFF_BASE_SECONDS = 0.5
+LATENCY_WINDOW = 10000
+
+
+class RetryAfter(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Flood control exceeded, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = None
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            if self.updated is not None:
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AiogramTransport:
+    def __init__(self, bot_configs, api_server_url=None):
+        from aiogram import Bot
+        from aiogram.client.session.aiohttp import AiohttpSession
+        from aiogram.client.telegram import TelegramAPIServer
+        from aiogram.exceptions import TelegramRetryAfter
+
+        self.retry_after_error = TelegramRetryAfter
+        self.bots = {}
+        for config in bot_configs:
+            session = AiohttpSession(api=TelegramAPIServer.from_base(api_server_url)) if api_server_url else None
+            self.bots[config['user_id']] = Bot(token=config['api_token'], session=session)
+
+    def __contains__(self, user_id):
+        return user_id in self.bots
+
+    async def send(self, user_id, chat_id, text):
+        try:
+            await self.bots[user_id].send_message(chat_id, text)
+        except self.retry_after_error as e:
+            raise RetryAfter(e.retry_after) from e
+
+    async def close(self):
+        for bot in self.bots.values():
+            await bot.session.close()
+            print(f"[DEBUG] Bot session closed.")
+
+
+class FakeTransport:
+    def __init__(self, user_ids, latency=0.0, flood_every=0, retry_after=1):
+        self.user_ids = set(user_ids)
+        self.latency = latency
+        self.flood_every = flood_every
+        self.retry_after = retry_after
+        self.attempts = 0
+        self.sent = []
+
+    def __contains__(self, user_id):
+        return user_id in self.user_ids
+
+    async def send(self, user_id, chat_id, text):
+        self.attempts += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.flood_every and self.attempts % self.flood_every == 0:
+            raise RetryAfter(self.retry_after)
+        self.sent.append((user_id, chat_id, text))
+
+    async def close(self):
+        pass
+
+
+class SendDispatcher:
+    def __init__(
+        self,
+        transport,
+        max_concurrency=MAX_CONCURRENT_SENDS,
+        bot_rate=BOT_MESSAGES_PER_SECOND,
+        chat_rate=CHAT_MESSAGES_PER_MINUTE / 60,
+        chat_burst=CHAT_MESSAGES_PER_MINUTE,
+        max_retries=MAX_RETRIES,
+        latency_window=LATENCY_WINDOW
+    ):
+        self.transport = transport
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.bot_rate = bot_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.queues = {}
+        self.workers = {}
+        self.bot_buckets = {}
+        self.chat_buckets = {}
+        self.sent = 0
+        self.failed = 0
+        self.latencies = deque(maxlen=latency_window)
+        self.started_at = None
+
+    def submit(self, user_id, chat_id, text):
+        loop = asyncio.get_running_loop()
+        if self.started_at is None:
+            self.started_at = loop.time()
+        queue = self.queues.get(user_id)
+        if queue is None:
+            queue = self.queues[user_id] = asyncio.Queue()
+            self.bot_buckets[user_id] = TokenBucket(self.bot_rate, self.bot_rate)
+            self.workers[user_id] = asyncio.create_task(self._worker(user_id, queue))
+        future = loop.create_future()
+        queue.put_nowait((chat_id, text, future, loop.time()))
+        return future
+
+    async def send(self, user_id, chat_id, text):
+        return await self.submit(user_id, chat_id, text)
+
+    async def _worker(self, user_id, queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            chat_id, text, future, queued_at = await queue.get()
+            try:
+                chat_bucket = self.chat_buckets.get((user_id, chat_id))
+                if chat_bucket is None:
+                    chat_bucket = self.chat_buckets[(user_id, chat_id)] = TokenBucket(self.chat_rate, self.chat_burst)
+                await self.bot_buckets[user_id].acquire()
+                await chat_bucket.acquire()
+                async with self.semaphore:
+                    delivered = await self._deliver(user_id, chat_id, text)
+                if delivered:
+                    self.sent += 1
+                    self.latencies.append(loop.time() - queued_at)
+                    metrics.observe("send_latency", self.latencies[-1])
+                    metrics.increment("send_delivered")
+                else:
+                    self.failed += 1
+                    metrics.increment("send_failures")
+                if not future.done():
+                    future.set_result(delivered)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                queue.task_done()
+
+    async def _deliver(self, user_id, chat_id, text):
+        for attempt in range(self.max_retries + 1):
+            try:
+                with metrics.timer("telegram_send"):
+                    await self.transport.send(user_id, chat_id, text)
+                print(f"[DEBUG] Bot {user_id}: Sending message to {chat_id}: {text}")
+                return True
+            except RetryAfter as e:
+                print(f"[WARNING] Bot {user_id}: {e}")
+                metrics.increment("send_retries")
+                await asyncio.sleep(e.retry_after + BACKOFF_BASE_SECONDS * 2 ** attempt)
+            except Exception as e:
+                print(f"[ERROR] Failed to send message: {e}")
+                return False
+        print(f"[ERROR] Giving up on message from {user_id} after {self.max_retries} retries.")
+        return False
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        elapsed = asyncio.get_running_loop().time() - self.started_at if self.started_at is not None else 0
+
+        def percentile(q):
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else 0.0
+
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "messages_per_second": self.sent / elapsed if elapsed else 0.0,
+            "latency_p50": percentile(0.5),
+            "latency_p95": percentile(0.95),
+            "latency_p99": percentile(0.99)
+        }
+
+    async def close(self):
+        for queue in self.queues.values():
+            await queue.join()
+        for worker in self.workers.values():
+            worker.cancel()
+        await asyncio.gather(*self.workers.values(), return_exceptions=True)
+        await self.transport.close()
@@ -1,36 +1,234 @@
-import json
+import heapq
+import os
+import threading
+from collections import OrderedDict, defaultdict
+import numpy as np
+import metrics
+from corpus_format import CORPUS_DIR, artifact_fresh, decode_strings, encode_strings, file_mtimes, load_messages, save_arrays
+from word_stats import WORD_STATS_FILE, WORD_STATS_TEXT_FILE, WordStats
+
+LEMMATIZED_DATA_FILE = 'data/lemmatized_output.json'
+SIMILARITY_CACHE_SIZE = 50000
+SIMILARITY_ARRAYS_DIR = 'data/similarity_index'
+SIMILARITY_ARRAYS = ('users', 'users_offsets', 'vocabulary', 'vocabulary_offsets', 'keys', 'offsets', 'message_ids', 'scores')
+SOURCE_FILES = (LEMMATIZED_DATA_FILE, os.path.join(CORPUS_DIR, 'lemmas.npy'), WORD_STATS_FILE, WORD_STATS_TEXT_FILE)
+ARRAY_FILES = tuple(os.path.join(SIMILARITY_ARRAYS_DIR, f"{name}.npy") for name in SIMILARITY_ARRAYS)
+
+_default_index = None
+_default_mtimes = None
+_default_lock = threading.Lock()
+
+
+class SimilarityIndex:
+    def __init__(self, lemmatized_data, inverse_z_scores, cache_size=SIMILARITY_CACHE_SIZE):
+        postings = defaultdict(lambda: defaultdict(list))
+        for message in lemmatized_data:
+            user_postings = postings[message['user_id']]
+            for word in set(message['lemmatized']):
+                user_postings[word].append(message['message_id'])
+
+        self.postings = {
+            user_id: {
+                word: (inverse_z_scores.get(word, 0.0), message_ids)
+                for word, message_ids in user_postings.items()
+            }
+            for user_id, user_postings in postings.items()
+        }
+        self.init_cache(cache_size)
+
+    def init_cache(self, cache_size):
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.cache_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def query(self, test_message, specific_user_id, max_messages=10):
+        user_postings = self.postings.get(specific_user_id, {})
+        score_sums = defaultdict(float)
+        common_counts = defaultdict(int)
+
+        for word in set(test_message):
+            if word not in user_postings:
+                continue
+            inv_zscore, message_ids = user_postings[word]
+            for message_id in message_ids:
+                score_sums[message_id] += inv_zscore
+                common_counts[message_id] += 1
+
+        return heapq.nlargest(
+            max_messages,
+            ((score_sums[message_id] / common_counts[message_id], message_id)
+             for message_id in score_sums)
+        )
+
+    def cached_query(self, test_message, specific_user_id, max_messages=10):
+        key = (specific_user_id, frozenset(test_message), max_messages)
+        with self.cache_lock:
+            message_scores = self.cache.get(key)
+            if message_scores is not None:
+                self.cache.move_to_end(key)
+                self.hits += 1
+        if message_scores is not None:
+            metrics.increment("similarity_cache_hits")
+            return message_scores
+
+        message_scores = tuple(self.query(test_message, specific_user_id, max_messages))
+        metrics.increment("similarity_cache_misses")
+        with self.cache_lock:
+            self.misses += 1
+            if self.cache_size:
+                self.cache[key] = message_scores
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return message_scores
+
+    def cache_stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self.cache),
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+class ArraySimilarityIndex(SimilarityIndex):
+    def __init__(self, arrays_dir=SIMILARITY_ARRAYS_DIR, cache_size=SIMILARITY_CACHE_SIZE):
+        self.arrays = {
+            name: np.load(os.path.join(arrays_dir, f"{name}.npy"), mmap_mode='r')
+            for name in SIMILARITY_ARRAYS
+        }
+        users = decode_strings(self.arrays['users'], self.arrays['users_offsets'])
+        vocabulary = decode_strings(self.arrays['vocabulary'], self.arrays['vocabulary_offsets'])
+        self.user_index = {user_id: index for index, user_id in enumerate(users)}
+        self.word_index = {word: index for index, word in enumerate(vocabulary)}
+        self.vocabulary_size = len(vocabulary)
+        self.score_list = self.arrays['scores'].tolist()
+        self.init_cache(cache_size)
+
+    def query(self, test_message, specific_user_id, max_messages=10):
+        user_index = self.user_index.get(specific_user_id)
+        if user_index is None:
+            return []
+        keys, offsets, posting_ids = self.arrays['keys'], self.arrays['offsets'], self.arrays['message_ids']
+        score_sums = defaultdict(float)
+        common_counts = defaultdict(int)
+
+        for word in set(test_message):
+            word_id = self.word_index.get(word)
+            if word_id is None:
+                continue
+            key = user_index * self.vocabulary_size + word_id
+            position = int(np.searchsorted(keys, key))
+            if position == len(keys) or keys[position] != key:
+                continue
+            inv_zscore = self.score_list[word_id]
+            for message_id in posting_ids[offsets[position]:offsets[position + 1]].tolist():
+                score_sums[message_id] += inv_zscore
+                common_counts[message_id] += 1
+
+        return heapq.nlargest(
+            max_messages,
+            ((score_sums[message_id] / common_counts[message_id], message_id)
+             for message_id in score_sums)
+        )
+
+
+def write_similarity_arrays(lemmatized_data, inverse_z_scores, output_dir=SIMILARITY_ARRAYS_DIR):
+    users, vocabulary = {}, {}
+    user_column, word_column, message_ids = [], [], []
+    for message in lemmatized_data:
+        user_index = users.setdefault(message['user_id'], len(users))
+        for word in set(message['lemmatized']):
+            user_column.append(user_index)
+            word_column.append(vocabulary.setdefault(word, len(vocabulary)))
+            message_ids.append(message['message_id'])
+
+    keys = np.asarray(user_column, dtype=np.int64) * len(vocabulary) + np.asarray(word_column, dtype=np.int64)
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    unique_keys, starts = np.unique(keys, return_index=True)
+    arrays = {
+        'keys': unique_keys,
+        'offsets': np.append(starts, len(keys)).astype(np.int64),
+        'message_ids': np.asarray(message_ids, dtype=np.int64)[order],
+        'scores': np.asarray([inverse_z_scores.get(word, 0.0) for word in vocabulary], dtype=np.float64)
+    }
+    arrays['users'], arrays['users_offsets'] = encode_strings(users)
+    arrays['vocabulary'], arrays['vocabulary_offsets'] = encode_strings(vocabulary)
+    save_arrays(arrays, output_dir)
+    return len(arrays['keys'])
+
+
+def similarity_arrays_fresh(array_paths=ARRAY_FILES, source_paths=SOURCE_FILES):
+    return artifact_fresh(array_paths, source_paths)
+
+
+def load_inverse_z_scores(inv_zscore_path):
+    with open(inv_zscore_path, 'r', encoding='utf-8') as file:
+        scores = {}
+        for line in file:
+            word, _, score = line.rsplit(': ', 2)
+            scores[word] = float(score)
+        return scores
+
+
+def load_word_scores(path=WORD_STATS_FILE):
+    if path.endswith('.npz'):
+        return WordStats.load(path)
+    return load_inverse_z_scores(path)
+
+
+def build_similarity_index(input_path, word_stats_path=WORD_STATS_FILE):
+    return SimilarityIndex(load_messages(input_path), load_word_scores(word_stats_path))
+
+
+def default_word_stats_path():
+    return WORD_STATS_FILE if os.path.exists(WORD_STATS_FILE) else WORD_STATS_TEXT_FILE
+
+
+def build_similarity_arrays(output_dir=SIMILARITY_ARRAYS_DIR):
+    return write_similarity_arrays(
+        load_messages(LEMMATIZED_DATA_FILE), load_word_scores(default_word_stats_path()), output_dir
+    )
+
+
+def get_similarity_index():
+    global _default_index, _default_mtimes
+    with _default_lock:
+        mtimes = file_mtimes(SOURCE_FILES + ARRAY_FILES)
+        if _default_index is None or mtimes != _default_mtimes:
+            try:
+                if similarity_arrays_fresh():
+                    _default_index = ArraySimilarityIndex()
+                else:
+                    _default_index = build_similarity_index(LEMMATIZED_DATA_FILE, default_word_stats_path())
+            except (OSError, ValueError, KeyError) as e:
+                if _default_index is None:
+                    raise
+                print(f"[WARNING] Keeping the previous similarity index, rebuild failed: {e}")
+                return _default_index
+            _default_mtimes = mtimes
+    return _default_index
 
 
 def find_similar_messages(
-    lemmatized_data,
+    similarity_index,
     test_message,
-    inverse_z_scores,
     specific_user_id,
     min_messages=5,
     max_messages=10
 ):
-    test_message_set = set(test_message)
-    message_scores = []
-
-    for message in lemmatized_data:
-        if message['user_id'] != specific_user_id:
-            continue
-        common_words = test_message_set.intersection(message['lemmatized'])
-        if common_words:
-            avg_inv_zscore = (
-                sum(inverse_z_scores[word] for word in common_words)
-                / len(common_words)
-            )
-            message_scores.append((avg_inv_zscore, message['message_id']))
+    with metrics.timer("similarity_lookup"):
+        message_scores = similarity_index.cached_query(test_message, specific_user_id, max_messages)
 
     if not message_scores:
         print(f"No messages found for user {specific_user_id} with common words.")
+        metrics.increment("similarity_empty")
         return []
 
-    message_scores.sort(reverse=True)
-    selected_messages = [
-        msg_id for score, msg_id in message_scores[:max_messages]
-    ]
+    selected_messages = [msg_id for score, msg_id in message_scores]
     print(f"Selected message IDs from user {specific_user_id}: {selected_messages}")
     return selected_messages
 
@@ -41,23 +239,11 @@ def process_similarity(
     min_messages=5,
     max_messages=10
 ):
-    input_path = 'data/lemmatized_output.json'
-    inv_zscore_path = 'data/word_inverse_zscore.txt'
     print(test_message, specific_user_id)
 
-    with open(input_path, 'r', encoding='utf-8') as file:
-        lemmatized_data = json.load(file)
-
-    with open(inv_zscore_path, 'r', encoding='utf-8') as file:
-        inverse_z_scores = {
-            line.split(': ')[0]: float(line.split(': ')[2].strip())
-            for line in file.readlines()
-        }
-
     message_ids = find_similar_messages(
-        lemmatized_data,
+        get_similarity_index(),
         test_message,
-        inverse_z_scores,
         specific_user_id,
         min_messages,
         max_messages
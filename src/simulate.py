@@ -0,0 +1,96 @@
+import argparse
+import contextlib
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from cluster_sampler import ClusterSampler, get_cluster_sampler
+from initialize_cluster import initialize_cluster, simulate_replies_one_by_one
+
+TRANSCRIPT_FILE = "data/simulation_transcript.jsonl"
+REPORT_FILE = "data/simulation_report.json"
+SIMULATION_START = "2024-09-02T09:00:00"
+
+class VirtualClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def sleep(self, seconds):
+        self.now += max(0.0, seconds)
+
+def summarize_latencies(latencies):
+    latencies = sorted(latencies)
+
+    def percentile(q):
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else 0.0
+
+    return {
+        "count": len(latencies),
+        "total": sum(latencies),
+        "p50": percentile(0.5),
+        "p95": percentile(0.95),
+        "p99": percentile(0.99),
+        "max": latencies[-1] if latencies else 0.0
+    }
+
+def run_simulation(clusters, seed, transcript_path=TRANSCRIPT_FILE, sampler=None, start=SIMULATION_START, quiet=True):
+    rng = random.Random(seed)
+    sampler = sampler if sampler is not None else get_cluster_sampler()
+    clock = VirtualClock()
+    started_at = datetime.fromisoformat(start)
+    stage_latencies = {"sample_cluster": [], "starter": [], "reply": []}
+    messages = 0
+
+    with contextlib.ExitStack() as stack:
+        transcript = stack.enter_context(open(transcript_path, 'w', encoding='utf-8'))
+        if quiet:
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, 'w'))))
+        wall_started = time.perf_counter()
+        for cluster_index in range(clusters):
+            stage_started = time.perf_counter()
+            cluster_info = initialize_cluster(sampler, rng)
+            stage_latencies["sample_cluster"].append(time.perf_counter() - stage_started)
+
+            replies = simulate_replies_one_by_one(cluster_info, sampler, rng=rng, sleep=clock.sleep)
+            for message_index in range(cluster_info["cluster"]["length"]):
+                stage_started = time.perf_counter()
+                reply = next(replies)
+                stage_latencies["starter" if message_index == 0 else "reply"].append(time.perf_counter() - stage_started)
+
+                transcript.write(json.dumps({
+                    "cluster": cluster_index,
+                    "index": message_index,
+                    "time": (started_at + timedelta(seconds=clock.now)).isoformat(),
+                    "from": reply["from"],
+                    "message": reply["message"]
+                }, ensure_ascii=False) + '\n')
+                messages += 1
+            clock.sleep(cluster_info["cluster"]["avg_cluster_delay"] / 100)
+        wall_seconds = time.perf_counter() - wall_started
+
+    return {
+        "seed": seed,
+        "clusters": clusters,
+        "messages": messages,
+        "wall_seconds": wall_seconds,
+        "messages_per_second": messages / wall_seconds if wall_seconds else 0.0,
+        "virtual_seconds": clock.now,
+        "stages": {stage: summarize_latencies(latencies) for stage, latencies in stage_latencies.items()}
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the conversation simulator headless on a virtual clock.")
+    parser.add_argument('--clusters', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--start', default=SIMULATION_START, help="ISO timestamp of the first simulated message")
+    parser.add_argument('--transcript', default=TRANSCRIPT_FILE)
+    parser.add_argument('--report', default=REPORT_FILE)
+    parser.add_argument('--verbose', action='store_true', help="keep the simulator's debug output")
+    args = parser.parse_args()
+
+    report = run_simulation(args.clusters, args.seed, args.transcript, ClusterSampler(), args.start, not args.verbose)
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    print(f"Simulated {report['messages']} messages in {report['clusters']} clusters "
+          f"({report['messages_per_second']:.1f} msg/s), transcript saved to {args.transcript}.")
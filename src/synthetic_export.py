@@ -0,0 +1,113 @@
+import argparse
+import json
+import os
+import random
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+SYNTHETIC_DATA_DIR = "data/synthetic"
+EXPORT_START = datetime(2024, 9, 2, 9, 0, 0)
+BASE_WORDS = (
+    "привет как дела сегодня завтра вчера лекция семинар пара домашка дедлайн экзамен зачёт курс задача "
+    "решение вопрос ответ преподаватель группа чат ссылка файл тест оценка балл проект команда код ошибка "
+    "функция данные модель график таблица отчёт презентация расписание аудитория перенос отмена спасибо "
+    "пожалуйста кто где когда почему можно нужно надо уже ещё тоже очень просто сложно понятно вообще"
+).split()
+SYLLABLES = "ба ве ги до ку ла ми но пу ра си то фу ха це ча ша ще ю я ли ро ны".split()
+CLUSTER_START_PROBABILITY = 0.08
+IN_CLUSTER_GAP_SECONDS = 60
+BETWEEN_CLUSTER_GAP_SECONDS = 3 * 3600
+
+def build_vocabulary(size, rng):
+    vocabulary = list(BASE_WORDS[:size])
+    seen = set(vocabulary)
+    while len(vocabulary) < size:
+        word = ''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4)))
+        if word not in seen:
+            seen.add(word)
+            vocabulary.append(word)
+    return vocabulary
+
+def generate_text(rng, vocabulary, cumulative_weights, users, link_density, mention_density):
+    entities = []
+    if rng.random() < mention_density:
+        entities.append({"type": "mention", "text": f"@{rng.choice(users)}"})
+        entities.append({"type": "plain", "text": " "})
+    sentences = []
+    for _ in range(rng.choice((1, 1, 1, 2, 2, 3))):
+        words = rng.choices(vocabulary, cum_weights=cumulative_weights, k=rng.randint(1, 12))
+        sentences.append(' '.join(words).capitalize() + rng.choice(('', '.', '!', '?', '...')))
+    entities.append({"type": "plain", "text": ' '.join(sentences)})
+    if rng.random() < link_density:
+        entities.append({"type": "plain", "text": " "})
+        entities.append({"type": "link", "text": f"https://example.com/{rng.randrange(10 ** 6)}?p={rng.randrange(100)}"})
+    return entities
+
+def generate_export(chat_id, users, messages, rng, vocabulary, link_density=0.05, mention_density=0.05,
+                    reply_density=0.3, start=EXPORT_START):
+    cumulative_weights = list(accumulate(1.0 / rank for rank in range(1, len(vocabulary) + 1)))
+    user_weights = list(accumulate(1.0 / rank for rank in range(1, len(users) + 1)))
+    timestamp = start
+    exported = []
+    for message_id in range(1, messages + 1):
+        if rng.random() < CLUSTER_START_PROBABILITY:
+            timestamp += timedelta(seconds=rng.expovariate(1 / BETWEEN_CLUSTER_GAP_SECONDS))
+        else:
+            timestamp += timedelta(seconds=rng.expovariate(1 / IN_CLUSTER_GAP_SECONDS))
+        user = rng.choices(users, cum_weights=user_weights)[0]
+        entities = generate_text(rng, vocabulary, cumulative_weights, users, link_density, mention_density)
+        message = {
+            "id": message_id,
+            "type": "message",
+            "date": timestamp.strftime('%Y-%m-%dT%H:%M:%S'),
+            "from": user,
+            "from_id": user,
+            "text": ''.join(entity["text"] for entity in entities),
+            "text_entities": entities
+        }
+        if message_id > 1 and rng.random() < reply_density:
+            message["reply_to_message_id"] = rng.randint(max(1, message_id - 20), message_id - 1)
+        exported.append(message)
+    return {"name": f"Synthetic chat {chat_id}", "type": "private_supergroup", "id": chat_id, "messages": exported}
+
+def write_exports(output_dir=SYNTHETIC_DATA_DIR, users=20, messages=10000, chats=4, vocabulary_size=2000,
+                  link_density=0.05, mention_density=0.05, reply_density=0.3, seed=0):
+    rng = random.Random(seed)
+    user_ids = [f"user{100000 + index}" for index in range(users)]
+    vocabulary = build_vocabulary(vocabulary_size, rng)
+    raw_dir = os.path.join(output_dir, "raw")
+    os.makedirs(raw_dir, exist_ok=True)
+
+    raw_files = []
+    for chat in range(chats):
+        chat_messages = messages // chats + (1 if chat < messages % chats else 0)
+        export = generate_export(
+            chat + 1, user_ids, chat_messages, rng, vocabulary, link_density, mention_density, reply_density
+        )
+        path = os.path.join(raw_dir, f"chat_{chat + 1}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(export, f, ensure_ascii=False, indent=1)
+        raw_files.append(path)
+
+    with open(os.path.join(output_dir, "config.json"), 'w', encoding='utf-8') as f:
+        json.dump([{"user_id": user_id, "api_token": ""} for user_id in user_ids], f, ensure_ascii=False, indent=1)
+    return raw_files, user_ids
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write synthetic Telegram exports for benchmarks.")
+    parser.add_argument('--output-dir', default=SYNTHETIC_DATA_DIR)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--messages', type=int, default=10000)
+    parser.add_argument('--chats', type=int, default=4)
+    parser.add_argument('--vocabulary-size', type=int, default=2000)
+    parser.add_argument('--link-density', type=float, default=0.05)
+    parser.add_argument('--mention-density', type=float, default=0.05)
+    parser.add_argument('--reply-density', type=float, default=0.3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    raw_files, user_ids = write_exports(
+        args.output_dir, args.users, args.messages, args.chats, args.vocabulary_size,
+        args.link_density, args.mention_density, args.reply_density, args.seed
+    )
+    print(f"Wrote {args.messages} messages from {len(user_ids)} users to {len(raw_files)} exports in {args.output_dir}.")
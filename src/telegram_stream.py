@@ -0,0 +1,104 @@
+import heapq
+import json
+import os
+
+STREAM_CHUNK_SIZE = 1 << 16
+REORDER_WINDOW = 1000
+WHITESPACE = ' \t\n\r'
+DELIMITERS = ',:]}' + WHITESPACE
+
+_decoder = json.JSONDecoder()
+
+class JsonStreamReader:
+    def __init__(self, file, chunk_size=STREAM_CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self.fill():
+                return self.buffer[self.pos] if self.pos < len(self.buffer) else ''
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} in JSON stream, found {found!r}")
+        self.pos += 1
+
+    def skip_comma(self):
+        if self.peek() == ',':
+            self.pos += 1
+
+    def decode(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            if (end == len(self.buffer) or self.buffer[end] not in DELIMITERS) and not self.eof and self.fill():
+                continue
+            self.pos = end
+            return value
+
+def iter_array_items(path, array_key, header=None, chunk_size=STREAM_CHUNK_SIZE):
+    with open(path, 'r', encoding='utf-8') as file:
+        reader = JsonStreamReader(file, chunk_size)
+        reader.expect('{')
+        while reader.peek() not in ('}', ''):
+            key = reader.decode()
+            reader.expect(':')
+            if key == array_key:
+                reader.expect('[')
+                while reader.peek() not in (']', ''):
+                    yield reader.decode()
+                    reader.skip_comma()
+                return
+            value = reader.decode()
+            if header is not None:
+                header[key] = value
+            reader.skip_comma()
+
+def iter_messages(path, header=None, chunk_size=STREAM_CHUNK_SIZE):
+    return iter_array_items(path, 'messages', header, chunk_size)
+
+def chat_key(header, path):
+    return str(header.get('id', os.path.basename(path)))
+
+def iter_saved_items(items, path, array_key):
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(f'{{\n {json.dumps(array_key, ensure_ascii=False)}: [')
+        count = 0
+        for count, item in enumerate(items, 1):
+            record = json.dumps(item, ensure_ascii=False, indent=1)
+            file.write(',\n' if count > 1 else '\n')
+            file.write('\n'.join('  ' + line for line in record.split('\n')))
+            yield item
+        file.write('\n ]\n}' if count else ']\n}')
+
+def sorted_within_window(items, key, window=REORDER_WINDOW):
+    heap = []
+    for order, item in enumerate(items):
+        heapq.heappush(heap, (key(item), order, item))
+        if len(heap) > window:
+            sort_key, _, item = heapq.heappop(heap)
+            yield sort_key, item
+    while heap:
+        sort_key, _, item = heapq.heappop(heap)
+        yield sort_key, item
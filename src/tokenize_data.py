@@ -1,52 +1,74 @@
+import argparse
 import json
 import re
+from concurrent.futures import ProcessPoolExecutor
 
-def attach_floating_punctuation(text):
-    return re.sub(r'\s([,;.!?])\s', r'\1 ', text)
+FLOATING_PUNCTUATION_PATTERN = re.compile(r'\s([,;.!?])\s')
+TOKEN_PATTERN = re.compile(
+    r"(?P<newline>\n)"
+    r"|@[\wА-Яа-яёЁ-]*(?P<mention_link>https?://\S+)"
+    r"|@[\wА-Яа-яёЁ-]+"
+    r"|[«»“”‘’„”“]?[\wА-Яа-яёЁ-]*(?P<link>https?://\S+)"
+    r"|[«»“”‘’„”“]?[\wА-Яа-яёЁ-]+[^\s\wА-Яа-яёЁ]*[«»“”‘’„”“]?"
+)
+TOKENIZE_CHUNK_SIZE = 5000
 
-def extract_links(message_text):
-    url_pattern = r'(https?://[^\s]+)'
-    return re.findall(url_pattern, message_text)
+def attach_floating_punctuation(text):
+    return FLOATING_PUNCTUATION_PATTERN.sub(r'\1 ', text)
 
 def tokenize_with_regex(message_text):
-    message_text = attach_floating_punctuation(message_text)
-    links = extract_links(message_text)
-
-    for i, link in enumerate(links):
-        message_text = message_text.replace(link, f"__LINK_{i}__")
-
-    pattern = r"@[\wА-Яа-яёЁ-]+|[«»“”‘’„”“]?[\wА-Яа-яёЁ-]+[^\s\wА-Яа-яёЁ]*[«»“”‘’„”“]?"
-    lines = message_text.split('\n')
     tokenized_with_tags = []
+    in_sentence = False
 
-    for line in lines:
-        tokens = re.findall(pattern, line)
-        if tokens:
-            tokenized_with_tags.append("__START__")
-        
-        for i, token in enumerate(tokens):
-            tokenized_with_tags.append(token)
-            if token.endswith('.') or i == len(tokens) - 1:
+    for match in TOKEN_PATTERN.finditer(attach_floating_punctuation(message_text)):
+        if match.lastgroup == 'newline':
+            if in_sentence:
                 tokenized_with_tags.append("__END__")
-                if i != len(tokens) - 1:
-                    tokenized_with_tags.append("__START__")
-    for i, link in enumerate(links):
-        tokenized_with_tags = [token.replace(f"__LINK_{i}__", link) for token in tokenized_with_tags]
+                in_sentence = False
+            continue
+
+        token = match.group()
+        if not in_sentence:
+            tokenized_with_tags.append("__START__")
+            in_sentence = True
+        tokenized_with_tags.append(token)
+        if match.lastgroup is None and token.endswith('.'):
+            tokenized_with_tags.append("__END__")
+            in_sentence = False
+
+    if in_sentence:
+        tokenized_with_tags.append("__END__")
     return tokenized_with_tags
 
-def process_json(input_path, output_path):
+def tokenize_texts(texts):
+    return [tokenize_with_regex(text) for text in texts]
+
+def process_json(input_path, output_path, workers=1, chunk_size=TOKENIZE_CHUNK_SIZE):
     with open(input_path, 'r', encoding='utf-8') as file:
         data = json.load(file)
-    
-    for message in data:
-        message['tokenized'] = tokenize_with_regex(message['text'])
+
+    texts = [message['text'] for message in data]
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            tokenized = [tokens for chunk in pool.map(tokenize_texts, chunks) for tokens in chunk]
+    else:
+        tokenized = tokenize_texts(texts)
+
+    for message, tokens in zip(data, tokenized):
+        message['tokenized'] = tokens
 
     with open(output_path, 'w', encoding='utf-8') as file:
         json.dump(data, file, ensure_ascii=False, indent=1)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tokenize the merged corpus.")
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--chunk-size', type=int, default=TOKENIZE_CHUNK_SIZE)
+    args = parser.parse_args()
+
     input_path = 'data/merged/merged.json'
     output_path = 'data/tokenized_output.json'
     
-    process_json(input_path, output_path)
+    process_json(input_path, output_path, args.workers, args.chunk_size)
     print(f"Tokenized data has been saved to {output_path}.")
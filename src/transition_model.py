@@ -0,0 +1,144 @@
+import os
+import random
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from itertools import accumulate
+import numpy as np
+from corpus_format import artifact_fresh, decode_strings, encode_strings, save_arrays
+
+START_TOKEN = '__START__'
+END_TOKEN = '__END__'
+TRANSITION_TABLES_DIR = 'data/transition_tables'
+TRANSITION_ARRAYS = (
+    'users', 'users_offsets', 'tokens', 'tokens_offsets', 'user_offsets', 'keys', 'next_offsets', 'next_ids', 'cumulative'
+)
+
+class TransitionModel:
+    def __init__(self, ngrams):
+        self.tokens = []
+        self.token_ids = {}
+        counts = defaultdict(lambda: defaultdict(int))
+        for ngram in ngrams:
+            ids = tuple(self.intern(token) for token in ngram)
+            counts[ids[:-1]][ids[-1]] += 1
+
+        self.transitions = {
+            prefix: (list(next_ids), list(accumulate(next_ids.values())))
+            for prefix, next_ids in counts.items()
+        }
+        self.start_id = self.token_ids.get(START_TOKEN)
+        self.end_id = self.token_ids.get(END_TOKEN)
+
+    def intern(self, token):
+        token_id = self.token_ids.get(token)
+        if token_id is None:
+            token_id = self.token_ids[token] = len(self.tokens)
+            self.tokens.append(token)
+        return token_id
+
+    def sample(self, prefix, rng=random):
+        candidates = self.transitions.get(prefix)
+        if not candidates:
+            return None
+        next_ids, cumulative = candidates
+        return next_ids[bisect_right(cumulative, rng.random() * cumulative[-1])]
+
+    def generate(self, max_words, rng=random):
+        prefix = (self.start_id,)
+        generated_ids = []
+        while len(generated_ids) < max_words:
+            next_id = self.sample(prefix, rng)
+            if next_id is None or next_id == self.end_id:
+                break
+            generated_ids.append(next_id)
+            prefix = tuple(generated_ids[-len(prefix):])
+        return [self.tokens[token_id] for token_id in generated_ids]
+
+def prefix_key(prefix, token_count):
+    key = 0
+    for token_id in prefix:
+        key = key * (token_count + 1) + token_id + 1
+    return key
+
+def transition_table_files(tables_dir=TRANSITION_TABLES_DIR):
+    return [os.path.join(tables_dir, f"{name}.npy") for name in TRANSITION_ARRAYS]
+
+def transition_tables_fresh(source_paths, tables_dir=TRANSITION_TABLES_DIR):
+    return artifact_fresh(transition_table_files(tables_dir), source_paths)
+
+def write_transition_tables(models, output_dir=TRANSITION_TABLES_DIR):
+    tokens = {}
+    users = []
+    user_prefixes = []
+    for user_id, model in models:
+        token_ids = [tokens.setdefault(token, len(tokens)) for token in model.tokens]
+        users.append(user_id)
+        user_prefixes.append([
+            (tuple(token_ids[token_id] for token_id in prefix), [token_ids[token_id] for token_id in next_ids], cumulative)
+            for prefix, (next_ids, cumulative) in model.transitions.items()
+        ])
+
+    user_offsets, keys, next_offsets, next_ids, cumulative = [0], [], [0], [], []
+    for prefixes in user_prefixes:
+        for key, prefix_next_ids, prefix_cumulative in sorted(
+            (prefix_key(prefix, len(tokens)), prefix_next_ids, prefix_cumulative)
+            for prefix, prefix_next_ids, prefix_cumulative in prefixes
+        ):
+            keys.append(key)
+            next_ids.extend(prefix_next_ids)
+            cumulative.extend(prefix_cumulative)
+            next_offsets.append(len(next_ids))
+        user_offsets.append(len(keys))
+
+    arrays = {
+        'user_offsets': np.asarray(user_offsets, dtype=np.int64),
+        'keys': np.asarray(keys, dtype=np.int64),
+        'next_offsets': np.asarray(next_offsets, dtype=np.int64),
+        'next_ids': np.asarray(next_ids, dtype=np.int64),
+        'cumulative': np.asarray(cumulative, dtype=np.int64)
+    }
+    arrays['users'], arrays['users_offsets'] = encode_strings(users)
+    arrays['tokens'], arrays['tokens_offsets'] = encode_strings(tokens)
+    save_arrays(arrays, output_dir)
+    return len(keys)
+
+class TransitionTables:
+    def __init__(self, tables_dir=TRANSITION_TABLES_DIR):
+        self.arrays = {
+            name: np.load(os.path.join(tables_dir, f"{name}.npy"), mmap_mode='r')
+            for name in TRANSITION_ARRAYS
+        }
+        self.tokens = decode_strings(self.arrays['tokens'], self.arrays['tokens_offsets'])
+        users = decode_strings(self.arrays['users'], self.arrays['users_offsets'])
+        self.user_index = {user_id: index for index, user_id in enumerate(users)}
+        self.user_offsets = self.arrays['user_offsets'].tolist()
+        self.keys = memoryview(self.arrays['keys'])
+        self.next_offsets = memoryview(self.arrays['next_offsets'])
+        self.next_ids = memoryview(self.arrays['next_ids'])
+        self.cumulative = memoryview(self.arrays['cumulative'])
+        self.start_id = next((index for index, token in enumerate(self.tokens) if token == START_TOKEN), None)
+        self.end_id = next((index for index, token in enumerate(self.tokens) if token == END_TOKEN), None)
+
+    def __contains__(self, user_id):
+        return user_id in self.user_index
+
+class ArrayTransitionModel(TransitionModel):
+    def __init__(self, tables, user_id):
+        user_index = tables.user_index[user_id]
+        self.tables = tables
+        self.tokens = tables.tokens
+        self.start_id = tables.start_id
+        self.end_id = tables.end_id
+        self.first = tables.user_offsets[user_index]
+        self.last = tables.user_offsets[user_index + 1]
+
+    def sample(self, prefix, rng=random):
+        if None in prefix:
+            return None
+        keys, next_offsets, cumulative = self.tables.keys, self.tables.next_offsets, self.tables.cumulative
+        key = prefix_key(prefix, len(self.tokens))
+        position = bisect_left(keys, key, self.first, self.last)
+        if position == self.last or keys[position] != key:
+            return None
+        start, end = next_offsets[position], next_offsets[position + 1]
+        return self.tables.next_ids[bisect_right(cumulative, rng.random() * cumulative[end - 1], start, end)]
@@ -0,0 +1,61 @@
+import os
+import numpy as np
+from corpus_format import decode_strings, encode_strings
+
+WORD_STATS_FILE = 'data/word_stats.npz'
+WORD_STATS_TEXT_FILE = 'data/word_inverse_zscore.txt'
+
+class WordStats:
+    def __init__(self, vocabulary, counts, scores):
+        self.vocabulary = vocabulary
+        self.counts = counts
+        self.scores = scores
+        self.index = {word: word_id for word_id, word in enumerate(vocabulary)}
+        self.score_list = scores.tolist()
+
+    @classmethod
+    def from_counts(cls, word_counter):
+        vocabulary = list(word_counter)
+        counts = np.fromiter(word_counter.values(), dtype=np.int64, count=len(vocabulary))
+        if not len(counts):
+            return cls(vocabulary, counts, np.zeros(0, dtype=np.float64))
+        mean_frequency = counts.mean()
+        std_dev = counts.std()
+        z_scores = np.abs(counts - mean_frequency) / std_dev if std_dev else np.zeros(len(counts))
+        return cls(vocabulary, counts, 1 / (1 + z_scores))
+
+    @classmethod
+    def load(cls, path=WORD_STATS_FILE):
+        with np.load(path) as arrays:
+            vocabulary = decode_strings(arrays['vocabulary'], arrays['vocabulary_offsets'])
+            return cls(vocabulary, arrays['counts'], arrays['scores'])
+
+    def save(self, path=WORD_STATS_FILE):
+        vocabulary, vocabulary_offsets = encode_strings(self.vocabulary)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'wb') as file:
+            np.savez(
+                file, vocabulary=vocabulary, vocabulary_offsets=vocabulary_offsets,
+                counts=self.counts, scores=self.scores
+            )
+        os.replace(temp_path, path)
+
+    def write_text(self, path=WORD_STATS_TEXT_FILE):
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            for word, count, score in zip(self.vocabulary, self.counts.tolist(), self.score_list):
+                file.write(f"{word}: {count}, Inverse Z-Score: {score:.4f}\n")
+        os.replace(temp_path, path)
+
+    def __len__(self):
+        return len(self.vocabulary)
+
+    def __contains__(self, word):
+        return word in self.index
+
+    def get(self, word, default=None):
+        word_id = self.index.get(word)
+        return self.score_list[word_id] if word_id is not None else default
+
+    def to_dict(self):
+        return dict(zip(self.vocabulary, self.score_list))